@@ -4,7 +4,10 @@ class Account:
 
     def get_balance(self):
         balance = self.exchange.fetch_balance()
-        
+        margin_balance = self.exchange.fetch_balance(params={'type': 'margin'})
+        self.report(balance, margin_balance)
+
+    def report(self, balance, margin_balance):
         print('='*40)
         usdt_balance = balance['total']['USDT']
         print(f'USDT balance: {round(usdt_balance, 2)}')
@@ -12,7 +15,6 @@ class Account:
         btc_balance = balance['total']['BTC']
         # print(f'BTC balance: {round(btc_balance, 2)}')
         
-        margin_balance = self.exchange.fetch_balance(params={'type': 'margin'})
         usdt_margin_balance = margin_balance['total']['USDT']
         print(f'USDT margin balance: {round(usdt_margin_balance, 2)}')
         btc_margin_balance = margin_balance['total']['BTC']
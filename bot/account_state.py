@@ -0,0 +1,73 @@
+import time
+
+# 残高とポジションをttl秒だけ使い回すキャッシュ(TradeとAccount/PositionManagerで共有する)
+# 自分で発注したら invalidate() で捨て、次の参照で取り直す
+# それ以外の変化(清算や手動の決済など)はttlの間は反映されないので、ttlは許容できる遅れにする
+# プライベートWebSocketのpositionトピックを受け取れる場合は update_positions() に渡すと、取得せずに最新になる
+#
+# usage:
+#   state = AccountState(exchange, "BTCUSDT", ttl=300)
+#   state = AccountState(exchange, None, ttl=300)   # USDT建ての全銘柄のポジションを1回で取得する
+#   positions = state.positions()          # ttl以内なら取得しない
+#   balance, margin = state.balance(), state.margin_balance()
+#   state.invalidate()                     # 発注した後
+#   state.update_positions(message["data"])  # Bybitのpositionトピック(任意)
+
+class AccountState:
+    def __init__(self, exchange, symbol="BTCUSDT", ttl=300):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.ttl = ttl
+        self.cache = {}  # {名前: (取得した時刻, 値)}
+        # 取得した回数とキャッシュから返した回数
+        self.requests = 0
+        self.hits = 0
+
+    def _fresh(self, name):
+        entry = self.cache.get(name)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self.hits += 1
+            return True
+        return False
+
+    def _store(self, name, value):
+        self.requests += 1
+        self.cache[name] = (time.monotonic(), value)
+        return value
+
+    def _get(self, name, fetch):
+        if self._fresh(name):
+            return self.cache[name][1]
+        return self._store(name, fetch())
+
+    def positions(self):
+        if self.symbol is None:
+            return self._get('positions', lambda: self.exchange.fetch_positions(params={'settleCoin': 'USDT'}))
+        return self._get('positions', lambda: self.exchange.fetch_positions([self.symbol]))
+
+    def balance(self):
+        return self._get('balance', lambda: self.exchange.fetch_balance())
+
+    def margin_balance(self):
+        return self._get('margin_balance', lambda: self.exchange.fetch_balance(params={'type': 'margin'}))
+
+    def invalidate(self, *names):
+        # 名前を省略するとすべて捨てる
+        for name in names or list(self.cache):
+            self.cache.pop(name, None)
+
+    def update_positions(self, data):
+        # Bybit v5のpositionトピックは変化した銘柄のポジションだけを送ってくるので、銘柄ごとに置き換える
+        # キャッシュがないときは他の銘柄が分からないので、そのまま使う
+        updated = self.exchange.parse_positions(data)
+        symbols = {position['symbol'] for position in updated}
+        entry = self.cache.get('positions')
+        current = [] if entry is None else [p for p in entry[1] if p['symbol'] not in symbols]
+        self.cache['positions'] = (time.monotonic(), current + updated)
+
+class AsyncAccountState(AccountState):
+    # ccxt.async_support の取引所オブジェクト用
+    async def _get(self, name, fetch):
+        if self._fresh(name):
+            return self.cache[name][1]
+        return self._store(name, await fetch())
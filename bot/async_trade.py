@@ -0,0 +1,77 @@
+import asyncio
+import ccxt.async_support
+from trade import Trade
+from position_manager import PositionManager
+from candle_store import AsyncCandleStore
+from account_state import AsyncAccountState
+
+# Tradeのasyncio版。1回のループで必要な取得(ローソク足・ポジション・残高)を同時に投げ、
+# 売買の判断に必要なローソク足とポジションだけを待ってから発注する。残高は判断に使わないので発注と並行して表示する
+# 判断と発注の処理はTradeと共通
+#
+# usage:
+#   trade = AsyncTrade(config, notifier=discord_notifier)
+#   message = await trade.run_once()
+#   message = await trade.run_once(df)   # KlineStreamのon_closeから(確定した足だけのdf)
+#   await trade.close()
+
+class AsyncTrade(Trade):
+    candle_store_class = AsyncCandleStore
+    account_state_class = AsyncAccountState
+
+    def __init__(self, config, notifier=None):
+        super().__init__(config, notifier)
+        self.timeframes = ["1m"]  # ["1m", "5m", "15m", "30m"]
+
+    def create_exchange(self, module=ccxt.async_support):
+        return super().create_exchange(module)
+
+    async def get_ohlcv(self, timeframe):
+        return await self.candles.fetch(self.strategy.market_symbol, timeframe)
+
+    async def get_market_data(self):
+        ohlcv_data = await asyncio.gather(*[self.get_ohlcv(timeframe) for timeframe in self.timeframes])
+        return ohlcv_data[0] if len(ohlcv_data) == 1 else list(ohlcv_data)
+
+    async def fetch_positions(self):
+        return await self.state.positions()
+
+    async def check_balance(self):
+        balance, margin_balance = await asyncio.gather(
+            self.state.balance(),
+            self.state.margin_balance(),
+        )
+        self.account.report(balance, margin_balance)
+
+    async def execute_trade(self, df, positions):
+        position_manager = PositionManager(self.exchange, self.strategy.symbol, positions)
+        long_positions, short_positions = position_manager.separate_positions_by_side()
+
+        action = self.decide_trade_action(long_positions, short_positions, df)
+        # The signed REST order goes through requests, so keep it off the event loop
+        result = await asyncio.to_thread(self.order_for_action, action)
+        return self.trade_message(action, result)
+
+    async def run_once(self, df=None):
+        # dfを渡したとき(KlineStreamで足が確定したとき)はローソク足を取得せず、確定した足だけとして扱う
+        balance = asyncio.create_task(self.check_balance())
+        try:
+            if df is None:
+                df, positions = await asyncio.gather(self.get_market_data(), self.fetch_positions())
+                df = self.prepare_data(df)
+            else:
+                positions = await self.fetch_positions()
+                df = self.prepare_data(df, forming=False)
+            return await self.execute_trade(df, positions)
+        finally:
+            # 残高の表示に失敗しても売買の結果は返す
+            try:
+                await balance
+            except Exception as e:
+                self.logger().error(f"Failed to fetch balance: {e}")
+
+    async def close(self):
+        await self.exchange.close()
+        self.client.close()
+        if self.owns_notifier:
+            self.discord_notifier.close()
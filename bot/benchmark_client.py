@@ -0,0 +1,119 @@
+import argparse
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+from bybit_client import BybitClient
+
+# 発注1回あたりの時間を、接続を使い回すBybitClientと旧実装(毎回新しい接続のrequests.post)で比較するベンチマーク
+# ローカルのhttp.serverをBybitの代わりに立てるので、APIキーもネットワークもいらない
+# あわせて、読み込みがタイムアウトしたPOSTを再試行しない(注文が二重に通らない)ことを確かめる
+# usage: python benchmark_client.py --orders 500 --delay-ms 0
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    hits = {}
+    connections = set()
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            self.rfile.read(length)
+        path = self.path.split('?')[0]
+        StandInHandler.hits[(self.command, path)] = StandInHandler.hits.get((self.command, path), 0) + 1
+        StandInHandler.connections.add(self.client_address)
+        if path == '/slow':
+            time.sleep(1.0)
+        elif self.delay:
+            time.sleep(self.delay)
+        body = json.dumps({'retCode': 0, 'retMsg': 'OK', 'result': {}}).encode()
+        # Headers and body in one write, otherwise delayed ACKs skew keep-alive timings
+        try:
+            self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                             % (len(body), body))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+def start_server(delay):
+    StandInHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def order_params():
+    return {
+        "category": "linear",
+        "symbol": "BTCUSDT",
+        "isLeverage": 1,
+        "side": "Buy",
+        "orderType": "Market",
+        "qty": "0.008",
+        "positionIdx": 0
+    }
+
+def legacy_order(url, client):
+    # 旧Trade.http_request: 呼び出しごとに新しい接続
+    payload = json.dumps(order_params())
+    return requests.post(url + "/v5/order/create", headers=client.headers(payload), data=payload)
+
+def pooled_order(url, client):
+    return client.request("POST", "/v5/order/create", order_params())
+
+def time_per_order(func, orders, url, client):
+    StandInHandler.connections.clear()
+    func(url, client)  # warm up
+    start = time.perf_counter()
+    for _ in range(orders):
+        func(url, client)
+    return (time.perf_counter() - start) / orders * 1e3, len(StandInHandler.connections)
+
+def check_retries(url):
+    # POSTは読み込みがタイムアウトしても1回だけ、GETは再試行する
+    client = BybitClient("key", "secret", url, timeout=(1, 0.2), retries=2, backoff_factor=0)
+    counts = {}
+    for method in ("POST", "GET"):
+        StandInHandler.hits.pop((method, '/slow'), None)
+        try:
+            client.request(method, "/slow", order_params())
+        except requests.exceptions.RequestException:
+            pass
+        counts[method] = StandInHandler.hits.get((method, '/slow'), 0)
+    client.close()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--delay-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    server, url = start_server(args.delay_ms / 1000)
+    client = BybitClient("key", "secret", url)
+
+    legacy, legacy_connections = time_per_order(legacy_order, args.orders, url, client)
+    pooled, pooled_connections = time_per_order(pooled_order, args.orders, url, client)
+    client.close()
+
+    print(f'orders={args.orders} server delay={args.delay_ms} ms')
+    print(f'{"":24}{"ms/order":>12}{"connections":>14}')
+    print(f'{"requests.post":24}{legacy:12.3f}{legacy_connections:14d}')
+    print(f'{"BybitClient (pooled)":24}{pooled:12.3f}{pooled_connections:14d}')
+    print(f'{"speedup":24}{legacy / pooled:11.2f}x')
+
+    counts = check_retries(url)
+    print(f'requests after a read timeout: POST={counts["POST"]} GET={counts["GET"]}')
+    server.shutdown()
+    if counts["POST"] != 1 or counts["GET"] != 3:
+        raise SystemExit("unexpected retry behaviour: POST must be sent once, GET retried twice")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import threading
+import time
+from rate_limiter import RateLimiter, LIMITS
+
+# RateLimiterを取引所の実際の制限(LIMITS)で回し、どのwindow秒を切り取っても回数がlimit以下かを数える
+# あわせて、注文が自分の枠(1秒10回)で待たされている間も、相場の取得が'ip'の枠いっぱいまで通ること、
+# 相場の取得で'ip'の枠が埋まっていても、注文はすぐに通ることを確かめる
+# usage: python benchmark_rate_limiter.py --seconds 12 --threads 4
+
+def hammer(limiter, lane, stop, log, lock):
+    while not stop.is_set():
+        limiter.acquire(lane)
+        with lock:
+            log.append((time.monotonic(), lane))
+
+def run(limiter, lanes, seconds):
+    # lanes: [(種類, スレッド数)]。記録は(時刻, 種類)
+    stop = threading.Event()
+    lock = threading.Lock()
+    log = []
+    threads = [threading.Thread(target=hammer, args=(limiter, lane, stop, log, lock))
+               for lane, n in lanes for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return log
+
+def max_in_window(times, window):
+    # 半開区間[t, t + window)に入る回数の最大
+    times = sorted(times)
+    best = 0
+    j = 0
+    for i in range(len(times)):
+        while times[i] - times[j] >= window:
+            j += 1
+        best = max(best, i - j + 1)
+    return best
+
+def buckets_of(lane):
+    return ['ip'] + ([lane] if lane in LIMITS else [])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=12)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+    failures = []
+
+    # 1. すべての種類を全力で叩いて、枠ごとの最大回数を数える
+    lanes = [('market', args.threads), ('order', 2), ('position', 2), ('account', 2)]
+    log = run(RateLimiter(), lanes, args.seconds)
+    print(f'requests={len(log)} seconds={args.seconds}')
+    print(f'{"bucket":12}{"limit":>8}{"window":>8}{"max seen":>10}')
+    for bucket, (limit, window) in LIMITS.items():
+        times = [t for t, lane in log if bucket in buckets_of(lane)]
+        seen = max_in_window(times, window)
+        print(f'{bucket:12}{limit:8d}{window:7d}s{seen:10d}')
+        if seen > limit:
+            failures.append(f'{bucket}: {seen} requests in {window}s, limit {limit}')
+
+    # 2. 注文が自分の枠で待っている間に、相場の取得が'ip'の枠を譲らされないか
+    seconds = args.seconds / 2
+    alone = run(RateLimiter(), [('market', args.threads)], seconds)
+    mixed = run(RateLimiter(), [('market', args.threads), ('order', 4)], seconds)
+    alone_rate = len(alone) / seconds
+    mixed_rate = sum(1 for _, lane in mixed if lane == 'market') / seconds
+    print(f'market throughput: alone {alone_rate:.1f}/s, with queued orders {mixed_rate:.1f}/s')
+    # 注文が使う'ip'の分(最大10/s)だけ減るのは正しい
+    if mixed_rate < alone_rate - LIMITS['order'][0] * 1.5:
+        failures.append(f'market data starved by queued orders: {mixed_rate:.1f}/s vs {alone_rate:.1f}/s')
+
+    # 3. 相場の取得で'ip'の枠が埋まっているときの注文の待ち時間
+    limiter = RateLimiter()
+    stop = threading.Event()
+    threads = [threading.Thread(target=hammer, args=(limiter, 'market', stop, [], threading.Lock()))
+               for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(1.0)
+    waits = []
+    for _ in range(10):
+        start = time.monotonic()
+        limiter.acquire('order')
+        waits.append(time.monotonic() - start)
+        time.sleep(0.2)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f'order wait with the ip bucket saturated: max {max(waits) * 1e3:.1f} ms')
+    if max(waits) > 0.1:
+        failures.append(f'orders waited {max(waits) * 1e3:.1f} ms behind market data')
+
+    if failures:
+        raise SystemExit('\n'.join(failures))
+
+if __name__ == '__main__':
+    main()
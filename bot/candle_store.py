@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+# (銘柄, 時間足)ごとに直近limit本のローソク足をリングバッファに保持し、前回の最後の足以降だけを取得する
+# 最後の足は形成中なので、次の取得で同じタイムスタンプの足が来たら置き換える
+# 長く止まっていて抜けがlimit本を超えたときは、従来どおりlimit本をまとめて取り直す
+#
+# usage:
+#   store = CandleStore(exchange, limit=500)
+#   df = store.fetch("BTC/USDT", "1m")     # 初回は500本、以降は通常2本だけ取得する
+
+class CandleRing:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, 5), dtype=np.float64)  # open, high, low, close, volume
+        self.size = 0
+        self.end = 0  # 次に書き込む位置
+
+    @property
+    def last_timestamp(self):
+        return int(self.timestamps[(self.end - 1) % self.capacity]) if self.size else None
+
+    def clear(self):
+        self.size = 0
+        self.end = 0
+
+    def merge(self, ohlcv):
+        # ohlcvは[timestamp, open, high, low, close, volume]のリスト(古い順)
+        for candle in ohlcv:
+            timestamp = candle[0]
+            last = self.last_timestamp
+            if last is not None and timestamp < last:
+                continue
+            if last is not None and timestamp == last:
+                i = (self.end - 1) % self.capacity  # Replace the partial candle
+            else:
+                i = self.end
+                self.end = (self.end + 1) % self.capacity
+                self.size = min(self.size + 1, self.capacity)
+            self.timestamps[i] = timestamp
+            self.values[i] = candle[1:6]
+
+    def to_frame(self):
+        order = (self.end - self.size + np.arange(self.size)) % self.capacity
+        df = pd.DataFrame(self.values[order], columns=["open", "high", "low", "close", "volume"])
+        df.set_index(pd.to_datetime(self.timestamps[order], unit="ms"), inplace=True)
+        df.index.name = "timestamp"
+        return df
+
+class CandleStore:
+    def __init__(self, exchange, limit=500, page_limit=200):
+        self.exchange = exchange
+        self.limit = limit
+        self.page_limit = page_limit
+        self.rings = {}
+        # 取得した回数と本数(帯域とレート制限の消費の目安)
+        self.requests = 0
+        self.candles_fetched = 0
+
+    def _fetch(self, symbol, timeframe, since=None, limit=None):
+        ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        self.requests += 1
+        self.candles_fetched += len(ohlcv)
+        return ohlcv
+
+    def ring(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        if key not in self.rings:
+            self.rings[key] = CandleRing(self.limit)
+        return self.rings[key]
+
+    def merge(self, symbol, timeframe, ohlcv):
+        # 取得以外(WebSocketなど)で受け取った足を書き込む
+        self.ring(symbol, timeframe).merge(ohlcv)
+
+    def frame(self, symbol, timeframe):
+        return self.ring(symbol, timeframe).to_frame()
+
+    def _ring(self, symbol, timeframe):
+        # 保持している足が古すぎれば空にする。戻り値のsinceがNoneならlimit本をまとめて取得する
+        ring = self.ring(symbol, timeframe)
+        timeframe_ms = self.exchange.parse_timeframe(timeframe) * 1000
+        last = ring.last_timestamp
+        if last is None or self.exchange.milliseconds() - last > (self.limit - 1) * timeframe_ms:
+            ring.clear()
+            return ring, None
+        return ring, last
+
+    def _caught_up(self, ohlcv, since):
+        return len(ohlcv) < self.page_limit or ohlcv[-1][0] <= since
+
+    def fetch(self, symbol, timeframe):
+        ring, since = self._ring(symbol, timeframe)
+        if since is None:
+            ring.merge(self._fetch(symbol, timeframe, limit=self.limit))
+            return ring.to_frame()
+
+        # 最後の足(形成中だった足)から取り直す。抜けが長ければページ単位で追いつく
+        while True:
+            ohlcv = self._fetch(symbol, timeframe, since=since, limit=self.page_limit)
+            ring.merge(ohlcv)
+            if self._caught_up(ohlcv, since):
+                break
+            since = ohlcv[-1][0]
+        return ring.to_frame()
+
+class AsyncCandleStore(CandleStore):
+    # ccxt.async_support の取引所オブジェクト用
+    async def _fetch(self, symbol, timeframe, since=None, limit=None):
+        ohlcv = await self.exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        self.requests += 1
+        self.candles_fetched += len(ohlcv)
+        return ohlcv
+
+    async def fetch(self, symbol, timeframe):
+        ring, since = self._ring(symbol, timeframe)
+        if since is None:
+            ring.merge(await self._fetch(symbol, timeframe, limit=self.limit))
+            return ring.to_frame()
+
+        while True:
+            ohlcv = await self._fetch(symbol, timeframe, since=since, limit=self.page_limit)
+            ring.merge(ohlcv)
+            if self._caught_up(ohlcv, since):
+                break
+            since = ohlcv[-1][0]
+        return ring.to_frame()
@@ -1,9 +1,98 @@
+import queue
+import threading
+import time
 from discord_webhook import DiscordWebhook
 
+# notify()はキューに積むだけで、送信はバックグラウンドのスレッドが行う(売買の処理はDiscordを待たない)
+# 短い間に続いた通知はまとめて1つのメッセージにする(Discordの上限2000文字ごとに分ける)
+# 429ならDiscordが返す待ち時間だけ、それ以外の失敗は倍々に待って送り直す
+# キューがいっぱいのときは捨てて、捨てた件数を次のメッセージに書き添える
+#
+# usage:
+#   notifier = DiscordNotifier(config)
+#   notifier.notify("entry_long: The order was successful.")
+#   notifier.close()    # 残っている通知を送ってから止める
+
+MAX_LENGTH = 2000
+
 class DiscordNotifier:
     def __init__(self, config):
         self.webhook_url = config.get("discord", "webhook_url")
+        self.batch_seconds = config.getfloat("discord", "batch_seconds", fallback=1.0)
+        self.max_retries = config.getint("discord", "max_retries", fallback=5)
+        self.queue = queue.Queue(maxsize=config.getint("discord", "queue_size", fallback=100))
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, name="discord-notifier", daemon=True)
+        self.worker.start()
 
     def notify(self, message):
-        webhook = DiscordWebhook(url=self.webhook_url, content=message)
-        webhook.execute()
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def close(self, timeout=10):
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.worker.join(timeout)
+
+    def _run(self):
+        while True:
+            messages = [self.queue.get()]
+            # 続けて来る通知をbatch_secondsだけ待ってまとめる
+            deadline = time.monotonic() + self.batch_seconds
+            while messages[-1] is not None:
+                remaining = deadline - time.monotonic()
+                try:
+                    messages.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = messages[-1] is None
+            messages = [str(message) for message in messages if message is not None]
+
+            with self.lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                messages.append(f"({dropped} notifications dropped)")
+            for content in self._split(messages):
+                self._send(content)
+            if stop:
+                return
+
+    def _split(self, messages):
+        contents = []
+        content = ""
+        for message in messages:
+            for i in range(0, max(len(message), 1), MAX_LENGTH):
+                part = message[i:i + MAX_LENGTH]
+                if content and len(content) + 1 + len(part) > MAX_LENGTH:
+                    contents.append(content)
+                    content = ""
+                content = f"{content}\n{part}" if content else part
+        if content:
+            contents.append(content)
+        return contents
+
+    def _send(self, content):
+        delay = 1.0
+        for _ in range(self.max_retries + 1):
+            try:
+                response = DiscordWebhook(url=self.webhook_url, content=content).execute()
+                if response.status_code == 429:
+                    retry_after = response.json().get("retry_after", delay)
+                    time.sleep(float(retry_after))
+                    continue
+                if response.status_code < 500:
+                    # 残りが0なら次の送信まで窓が開くのを待つ
+                    if response.headers.get("X-RateLimit-Remaining") == "0":
+                        time.sleep(float(response.headers.get("X-RateLimit-Reset-After", 0)))
+                    return
+            except Exception as e:
+                print(f"Discord notification failed: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+        print(f"Discord notification dropped after {self.max_retries} retries")
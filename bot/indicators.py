@@ -0,0 +1,346 @@
+import copy
+import math
+from collections import deque
+import pandas as pd
+
+# 確定した足を1本ずつ受け取って更新するテクニカル指標(1本あたりO(1))
+# talibと同じ初期値の取り方と漸化式で更新するので、同じ履歴を与えればtalibのバッチ計算と同じ値になる
+# SMA, EMA, MACD, 最大・最小はビット単位で一致する。RSI, ATR, BBはtalibのバージョンによって
+# 割り算の順番や標準偏差の計算方法が違うので、丸め誤差の範囲(相対1e-12程度)で一致する
+# update()は確定した足で状態を進め、peek()は形成中の足の値を状態を変えずに返す
+#
+# usage:
+#   engine = IndicatorEngine({'SMA20': SMA(20), 'ATR': ATR(210, style='ta'), 'MACD': MACD(), 'BB': BollingerBands(20)})
+#   for timestamp, candle in closed.iterrows():     # 確定した足
+#       engine.update(timestamp, candle)
+#   engine.peek(forming_candle)                      # {'SMA20': ..., 'MACD': ..., 'MACD_signal': ..., 'BB_UPPER': ...}
+
+NAN = float('nan')
+
+def _is_zero(value):
+    # TA_IS_ZERO
+    return -0.00000001 < value < 0.00000001
+
+class SMA:
+    # talib.SMAと同じく、直近period-1本の合計に新しい値を足して割り、最も古い値を引く
+    outputs = ('',)
+
+    def __init__(self, period, source='close'):
+        self.period = period
+        self.source = source
+        self.window = deque()
+        self.total = 0.0
+
+    def _value(self, total):
+        return total / self.period if len(self.window) == self.period - 1 else NAN
+
+    def peek(self, candle):
+        return self._value(self.total + candle[self.source])
+
+    def update(self, candle):
+        x = candle[self.source]
+        self.total += x
+        value = self._value(self.total)
+        self.window.append(x)
+        if len(self.window) == self.period:
+            self.total -= self.window.popleft()
+        return value
+
+class EMA:
+    # talib.EMA: 最初のperiod本の単純平均を初期値にし、以降は prev + (x - prev) * k
+    outputs = ('',)
+
+    def __init__(self, period, source='close'):
+        self.period = period
+        self.source = source
+        self.k = 2.0 / (period + 1)
+        self.seed = []
+        self.prev = None
+
+    def _next(self, x):
+        if self.prev is not None:
+            return ((x - self.prev) * self.k) + self.prev
+        if len(self.seed) == self.period - 1:
+            return sum(self.seed + [x]) / self.period
+        return None
+
+    def peek(self, candle):
+        value = self._next(candle if self.source is None else candle[self.source])
+        return NAN if value is None else value
+
+    def update(self, candle):
+        x = candle if self.source is None else candle[self.source]
+        value = self._next(x)
+        if value is None:
+            self.seed.append(x)
+            return NAN
+        self.prev = value
+        self.seed = []
+        return value
+
+class MACD:
+    # talib.MACD: 速いEMAは遅いEMAと同じ足で初期値が揃うように、slow - fast本目から計算を始める
+    # macd, signal, histの3つともシグナルの初期値が揃う足から出力する
+    outputs = ('', '_signal', '_hist')
+
+    def __init__(self, fast=12, slow=26, signal=9, source='close'):
+        self.source = source
+        self.fast = EMA(fast, source=None)
+        self.slow = EMA(slow, source=None)
+        self.signal = EMA(signal, source=None)
+        self.skip = slow - fast
+        self.count = 0
+
+    def _result(self, macd, signal):
+        if math.isnan(signal):
+            return NAN, NAN, NAN
+        return macd, signal, macd - signal
+
+    def peek(self, candle):
+        x = candle[self.source]
+        fast = self.fast.peek(x) if self.count >= self.skip else NAN
+        macd = fast - self.slow.peek(x)
+        if math.isnan(macd):
+            return NAN, NAN, NAN
+        return self._result(macd, self.signal.peek(macd))
+
+    def update(self, candle):
+        x = candle[self.source]
+        fast = self.fast.update(x) if self.count >= self.skip else NAN
+        self.count += 1
+        macd = fast - self.slow.update(x)
+        if math.isnan(macd):
+            return NAN, NAN, NAN
+        return self._result(macd, self.signal.update(macd))
+
+class RSI:
+    # talib.RSI: 最初のperiod本の値幅の平均を初期値にし、以降はWilderの平滑化
+    outputs = ('',)
+
+    def __init__(self, period=14, source='close'):
+        self.period = period
+        self.source = source
+        self.prev_close = None
+        self.gain = 0.0
+        self.loss = 0.0
+        self.count = 0
+
+    def _next(self, x):
+        diff = x - self.prev_close
+        gain, loss = self.gain, self.loss
+        if self.count >= self.period:
+            loss *= (self.period - 1)
+            gain *= (self.period - 1)
+        if diff < 0:
+            loss -= diff
+        else:
+            gain += diff
+        if self.count + 1 >= self.period:
+            loss /= self.period
+            gain /= self.period
+        return gain, loss
+
+    def _value(self, gain, loss):
+        if self.count + 1 < self.period:
+            return NAN
+        total = gain + loss
+        return 100.0 * (gain / total) if not _is_zero(total) else 0.0
+
+    def peek(self, candle):
+        if self.prev_close is None:
+            return NAN
+        return self._value(*self._next(candle[self.source]))
+
+    def update(self, candle):
+        x = candle[self.source]
+        if self.prev_close is None:
+            self.prev_close = x
+            return NAN
+        self.gain, self.loss = self._next(x)
+        value = self._value(self.gain, self.loss)
+        self.prev_close = x
+        self.count += 1
+        return value
+
+class ATR:
+    # style='talib': talib.ATR。2本目からperiod本のTRの平均を初期値にし、period本目から出力する
+    # style='ta': ta.volatility.AverageTrueRange。1本目のTRを高値-安値とし、period-1本目から出力する
+    #             (taは初期値をpandasのmean、つまりnumpyの合計で計算する)
+    outputs = ('',)
+
+    def __init__(self, period=14, style='talib'):
+        if style not in ('talib', 'ta'):
+            raise ValueError(f"unknown ATR style: {style}")
+        self.period = period
+        self.style = style
+        self.prev_close = None
+        self.trs = []
+        self.atr = None
+
+    def _true_range(self, candle):
+        high, low = candle['high'], candle['low']
+        greatest = high - low
+        if self.prev_close is None:
+            return greatest if self.style == 'ta' else None
+        greatest = max(greatest, abs(self.prev_close - high))
+        return max(greatest, abs(self.prev_close - low))
+
+    def _next(self, tr):
+        if tr is None:
+            return None
+        if self.atr is not None:
+            return (self.atr * (self.period - 1) + tr) / self.period
+        if len(self.trs) == self.period - 1:
+            if self.style == 'ta':
+                return float(pd.Series(self.trs + [tr]).mean())
+            return sum(self.trs + [tr]) / self.period
+        return None
+
+    def peek(self, candle):
+        value = self._next(self._true_range(candle))
+        return NAN if value is None else value
+
+    def update(self, candle):
+        tr = self._true_range(candle)
+        value = self._next(tr)
+        self.prev_close = candle['close']
+        if value is None:
+            if tr is not None:
+                self.trs.append(tr)
+            return NAN
+        self.atr = value
+        self.trs = []
+        return value
+
+class BollingerBands:
+    # talib.BBANDS(matype=0): 中心はSMA、幅は母標準偏差のnbdev倍
+    # 分散は二乗和の差(E[x^2] - E[x]^2)だと価格が大きいときに桁落ちするので、Welfordの方法で窓をずらして更新する
+    # 丸め誤差がたまらないよう、period本ごとに窓から計算し直す
+    outputs = ('_UPPER', '_MIDDLE', '_LOWER')
+
+    def __init__(self, period=20, nbdev=2, source='close'):
+        self.period = period
+        self.nbdev = nbdev
+        self.source = source
+        self.sma = SMA(period, source)
+        self.window = deque()  # 直近period-1本
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.count = 0
+
+    def _add(self, x):
+        # 窓にxを加えたときの平均と偏差平方和
+        delta = x - self.mean
+        mean = self.mean + delta / (len(self.window) + 1)
+        return mean, self.m2 + delta * (x - mean)
+
+    def _bands(self, middle, m2):
+        if math.isnan(middle):
+            return NAN, NAN, NAN
+        variance = m2 / self.period
+        # TA_IS_ZERO_OR_NEG: talibはごく小さい分散を0として扱う
+        dev = math.sqrt(variance) * self.nbdev if not variance < 0.00000001 else 0.0
+        return middle + dev, middle, middle - dev
+
+    def peek(self, candle):
+        return self._bands(self.sma.peek(candle), self._add(candle[self.source])[1])
+
+    def update(self, candle):
+        x = candle[self.source]
+        middle = self.sma.update(candle)
+        mean, m2 = self._add(x)
+        bands = self._bands(middle, m2)
+
+        self.window.append(x)
+        self.count += 1
+        if len(self.window) == self.period:
+            oldest = self.window.popleft()
+            n = self.period - 1
+            if self.count % self.period == 0:
+                mean = sum(self.window) / n
+                m2 = sum((v - mean) ** 2 for v in self.window)
+            else:
+                delta = oldest - mean
+                mean -= delta / n
+                m2 -= delta * (oldest - mean)
+        self.mean, self.m2 = mean, m2
+        return bands
+
+class RollingMax:
+    # 単調減少のdequeで直近period本の最大値を保つ(pandasのrolling(period).max()と同じ)
+    outputs = ('',)
+    sign = 1
+
+    def __init__(self, period, source='high'):
+        self.period = period
+        self.source = source
+        self.count = 0
+        self.window = deque()  # (index, value)
+
+    def _better(self, a, b):
+        return a >= b if self.sign > 0 else a <= b
+
+    def peek(self, candle):
+        x = candle[self.source]
+        if self.count + 1 < self.period:
+            return NAN
+        # The front may fall out of the window on this bar, then the next one is the extreme
+        front = self.window[0] if self.window and self.window[0][0] > self.count - self.period else \
+            (self.window[1] if len(self.window) > 1 else None)
+        return x if front is None or self._better(x, front[1]) else front[1]
+
+    def update(self, candle):
+        x = candle[self.source]
+        while self.window and self._better(x, self.window[-1][1]):
+            self.window.pop()
+        self.window.append((self.count, x))
+        if self.window[0][0] <= self.count - self.period:
+            self.window.popleft()
+        self.count += 1
+        return self.window[0][1] if self.count >= self.period else NAN
+
+class RollingMin(RollingMax):
+    sign = -1
+
+    def __init__(self, period, source='low'):
+        super().__init__(period, source)
+
+class IndicatorEngine:
+    def __init__(self, indicators, history=500):
+        # indicators: {名前: 指標}。MACDやBollingerBandsは名前+接尾辞('MACD_signal', 'BB_UPPER'など)の列になる
+        self._initial = copy.deepcopy(indicators)
+        self.history_size = history
+        self.reset()
+
+    @property
+    def names(self):
+        return [name + suffix for name, indicator in self.indicators.items() for suffix in indicator.outputs]
+
+    def reset(self):
+        self.indicators = copy.deepcopy(self._initial)
+        self.history = deque(maxlen=self.history_size)  # (timestamp, {名前: 値})
+        self.last_timestamp = None
+
+    def _flatten(self, values):
+        outputs = {}
+        for (name, indicator), value in zip(self.indicators.items(), values):
+            if len(indicator.outputs) == 1:
+                value = (value,)
+            for suffix, v in zip(indicator.outputs, value):
+                outputs[name + suffix] = v
+        return outputs
+
+    def update(self, timestamp, candle):
+        outputs = self._flatten([indicator.update(candle) for indicator in self.indicators.values()])
+        self.history.append((timestamp, outputs))
+        self.last_timestamp = timestamp
+        return outputs
+
+    def peek(self, candle):
+        return self._flatten([indicator.peek(candle) for indicator in self.indicators.values()])
+
+    def frame(self, index):
+        # 履歴から指定した足の値をDataFrameにする(履歴にない足はNaN)
+        history = dict(self.history)
+        empty = dict.fromkeys(self.names, NAN)
+        return pd.DataFrame([history.get(timestamp, empty) for timestamp in index], index=index, columns=self.names)
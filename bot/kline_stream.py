@@ -0,0 +1,102 @@
+import asyncio
+import json
+import pandas as pd
+import websockets
+from logger import Logger
+
+# Bybitのkline WebSocketを購読し、足が確定した瞬間にon_closeを呼ぶ(1分ごとのポーリングの代わり)
+# 受け取った足はCandleStoreのリングに書き込むので、形成中の足も含めて常に最新になる
+# 接続(再接続)のたびに、購読してからRESTで前回の足以降を取り直すので、切れていた間の足も抜けない
+# 接続中にメッセージを取りこぼして足が飛んだときも、RESTで取り直す
+# on_closeには確定した足だけのDataFrameを渡す(最後の行が確定したばかりの足)
+#
+# usage:
+#   store = AsyncCandleStore(exchange, limit=500)
+#   stream = KlineStream(store, "BTC/USDT", "1m", on_close)   # async def on_close(df): ...
+#   await stream.run()
+#   # ローカルで再生するときは url="ws://127.0.0.1:8765" のように渡す
+
+PUBLIC_URL = "wss://stream.bybit.com/v5/public/linear"
+
+def kline_interval(timeframe_seconds):
+    # ccxtの時間足(秒)をBybitのinterval("1", "60", "D"など)にする
+    minutes = timeframe_seconds // 60
+    return {1440: "D", 10080: "W", 43200: "M"}.get(minutes, str(minutes))
+
+class KlineStream:
+    def __init__(self, store, symbol, timeframe, on_close, url=PUBLIC_URL, topic_symbol=None,
+                 ping_interval=20, reconnect_delay=1, max_reconnect_delay=60):
+        self.store = store
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.on_close = on_close
+        self.url = url
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        timeframe_seconds = store.exchange.parse_timeframe(timeframe)
+        self.timeframe_ms = timeframe_seconds * 1000
+        self.topic = f"kline.{kline_interval(timeframe_seconds)}.{topic_symbol or symbol.replace('/', '')}"
+        self.last_closed = None  # 最後にon_closeへ渡した足のタイムスタンプ(ms)
+        self.reconnects = 0
+        self.backfills = 0
+        self.logger = Logger("kline_stream")
+
+    async def run(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=None) as ws:
+                    await ws.send(json.dumps({"op": "subscribe", "args": [self.topic]}))
+                    heartbeat = asyncio.create_task(self._heartbeat(ws))
+                    try:
+                        await self.backfill()
+                        delay = self.reconnect_delay
+                        while True:
+                            # pingの応答も来ないまま2回分待ったら、接続が死んでいるとみなす
+                            message = await asyncio.wait_for(ws.recv(), self.ping_interval * 2)
+                            await self.handle(json.loads(message))
+                    finally:
+                        heartbeat.cancel()
+            except Exception as e:
+                self.logger().error(f"Kline stream disconnected: {e!r}")
+            self.reconnects += 1
+            print(f"Reconnecting kline stream in {delay} seconds...")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _heartbeat(self, ws):
+        try:
+            while True:
+                await asyncio.sleep(self.ping_interval)
+                await ws.send(json.dumps({"op": "ping"}))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def backfill(self):
+        # RESTで前回の足以降を取り直す。最後の足は形成中なので、その1本前までを確定した足とする
+        self.backfills += 1
+        df = await self.store.fetch(self.symbol, self.timeframe)
+        if len(df) > 1:
+            await self.emit(df.index[-2].value // 10 ** 6)
+
+    async def handle(self, message):
+        if message.get("topic") != self.topic:
+            return  # subscribe/pingの応答
+        ring = self.store.ring(self.symbol, self.timeframe)
+        for kline in message["data"]:
+            candle = [int(kline["start"]), float(kline["open"]), float(kline["high"]),
+                      float(kline["low"]), float(kline["close"]), float(kline["volume"])]
+            last = ring.last_timestamp
+            if last is not None and candle[0] > last + self.timeframe_ms:
+                await self.backfill()
+            self.store.merge(self.symbol, self.timeframe, [candle])
+            if kline["confirm"]:
+                await self.emit(candle[0])
+
+    async def emit(self, timestamp):
+        if self.last_closed is not None and timestamp <= self.last_closed:
+            return
+        self.last_closed = timestamp
+        df = self.store.frame(self.symbol, self.timeframe)
+        await self.on_close(df[df.index <= pd.to_datetime(timestamp, unit="ms")])
@@ -3,8 +3,8 @@ from trade import Trade
 # from predict import Predictor
 from logger import Logger
 from discord_notifier import DiscordNotifier
+from scheduler import CandleScheduler
 from datetime import datetime
-import time
 
 def main():
     # Read configuration
@@ -12,27 +12,29 @@ def main():
     config.read("config.ini")
 
     # Initialize components
-    trade = Trade(config)
+    # 通知はTradeと共有して、同じ足の通知を1つのメッセージにまとめる
+    discord_notifier = DiscordNotifier(config)
+    trade = Trade(config, notifier=discord_notifier)
     # predictor = Predictor(config)
     logger = Logger("main")
-    discord_notifier = DiscordNotifier(config)
+    # 1分足の境界の少し後に起こす
+    scheduler = CandleScheduler(trade.exchange, "1m", delay_ms=config.getint("bot", "tick_delay_ms", fallback=50))
 
     print("Main function started.")
 
     # Main loop
     while True:
         try:
+            tick = scheduler.wait()
+
             # Get market data
             df = trade.get_market_data()
             df = trade.prepare_data(df)
 
             # Execute trade
             trade_result = trade.execute_trade(df)
+            scheduler.done(tick)
             discord_notifier.notify(trade_result)
-            
-            wait_time_minutes = 1
-            print(f"Waiting for {wait_time_minutes} minutes before continuing...")
-            time.sleep(wait_time_minutes * 60)
 
         except Exception as e:
             logger().error(f"An exception occurred: {e}")
@@ -0,0 +1,59 @@
+import asyncio
+import configparser
+from async_trade import AsyncTrade
+from multi_trade import MultiSymbolTrade
+from kline_stream import KlineStream
+from scheduler import AsyncCandleScheduler
+from logger import Logger
+from discord_notifier import DiscordNotifier
+
+# main.pyのasyncio版。ローソク足・ポジション・残高の取得を同時に行う
+# config.iniの[bot] mode = stream なら、1分ごとのポーリングの代わりにWebSocketで足の確定を待つ
+# [bot] symbols があれば複数の銘柄を売買する(ストリーミングは1銘柄のときだけ)
+
+async def main():
+    # Read configuration
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+
+    # Initialize components
+    # 通知はTradeと共有して、同じ足の通知を1つのメッセージにまとめる
+    discord_notifier = DiscordNotifier(config)
+    trade_class = MultiSymbolTrade if config.has_option("bot", "symbols") else AsyncTrade
+    trade = trade_class(config, notifier=discord_notifier)
+    logger = Logger("main")
+
+    print("Main function started.")
+
+    async def on_close(df):
+        try:
+            trade_result = await trade.run_once(df)
+            discord_notifier.notify(trade_result)
+        except Exception as e:
+            logger().error(f"An exception occurred: {e}")
+            discord_notifier.notify(f"An exception occurred: {e}")
+
+    try:
+        if config.get("bot", "mode", fallback="poll") == "stream" and not isinstance(trade, MultiSymbolTrade):
+            await KlineStream(trade.candles, trade.strategy.market_symbol, "1m", on_close).run()
+
+        # 1分足の境界の少し後に起こす
+        scheduler = AsyncCandleScheduler(trade.exchange, "1m", delay_ms=config.getint("bot", "tick_delay_ms", fallback=50))
+
+        # Main loop
+        while True:
+            try:
+                tick = await scheduler.wait()
+                trade_result = await trade.run_once()
+                scheduler.done(tick)
+                discord_notifier.notify(trade_result)
+
+            except Exception as e:
+                logger().error(f"An exception occurred: {e}")
+                discord_notifier.notify(f"An exception occurred: {e}")
+    finally:
+        await trade.close()
+        discord_notifier.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
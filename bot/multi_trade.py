@@ -0,0 +1,67 @@
+import asyncio
+from async_trade import AsyncTrade
+from position_manager import PositionManager
+from strategy import Strategy
+
+# 複数の銘柄を1つのプロセスで売買する(AsyncTradeの複数銘柄版)
+# 取引所オブジェクト・接続プール・レート制限・残高とポジションのキャッシュはすべての銘柄で共有し、
+# 銘柄ごとの状態(ポートフォリオと指標)はStrategyに分ける
+# ローソク足は全銘柄を同時に取得し、届いた銘柄から順に判断・発注する。ポジションはUSDT建ての全銘柄を1回で取得する
+# 1つの銘柄で失敗しても、その銘柄のメッセージにして他の銘柄は続ける
+#
+# config.ini:
+#   [bot]
+#   symbols = BTC/USDT, ETH/USDT, SOL/USDT
+#   [qty]                # 銘柄ごとに必須(ないとValueError)
+#   BTCUSDT = 0.008
+#   ETHUSDT = 0.1
+#   SOLUSDT = 1
+#   [exchange]
+#   pool_maxsize = 16    # 同時に出す注文の数の目安
+#
+# usage:
+#   trade = MultiSymbolTrade(config, notifier=discord_notifier)
+#   message = await trade.run_once()    # 銘柄ごとの結果を改行でつないだもの
+
+class MultiSymbolTrade(AsyncTrade):
+    def __init__(self, config, notifier=None):
+        # 発注の数量は銘柄によって桁が違うので、既定値は使わない
+        self.strategies = []
+        for symbol in config.get("bot", "symbols").split(","):
+            symbol = symbol.strip()
+            if not config.has_option("qty", symbol.replace("/", "")):
+                raise ValueError(f"config.ini has no order size for {symbol}: add '{symbol.replace('/', '')} = <qty>' to [qty]")
+            self.strategies.append(Strategy(symbol, qty=config.getfloat("qty", symbol.replace("/", ""))))
+        super().__init__(config, notifier)
+        self.strategy = self.strategies[0]
+        self.state = self.account_state_class(self.exchange, None, ttl=self.state.ttl)
+
+    def set_position_modes(self):
+        # Tradeの既定の銘柄ではなく、設定したすべての銘柄
+        return all([self.set_position_mode(0, strategy.symbol) for strategy in self.strategies])
+
+    async def trade_symbol(self, strategy, positions):
+        try:
+            df = strategy.prepare_data(await self.candles.fetch(strategy.market_symbol, "1m"))
+            position_manager = PositionManager(self.exchange, strategy.symbol, await positions)
+            long_positions, short_positions = position_manager.separate_positions_by_side()
+
+            action = strategy.decide_trade_action(long_positions, short_positions, df)
+            result = await asyncio.to_thread(self.order_for_action, action, strategy)
+            return f"{strategy.symbol} {self.trade_message(action, result)}"
+        except Exception as e:
+            self.logger().error(f"{strategy.symbol}: An exception occurred: {e}")
+            return f"{strategy.symbol} An exception occurred: {e}"
+
+    async def run_once(self):
+        balance = asyncio.create_task(self.check_balance())
+        positions = asyncio.create_task(self.fetch_positions())
+        try:
+            messages = await asyncio.gather(*[self.trade_symbol(strategy, positions) for strategy in self.strategies])
+            return "\n".join(messages)
+        finally:
+            await asyncio.gather(positions, return_exceptions=True)
+            try:
+                await balance
+            except Exception as e:
+                self.logger().error(f"Failed to fetch balance: {e}")
@@ -1,22 +1,28 @@
 class PositionManager:
-    def __init__(self, exchange, symbol):
+    def __init__(self, exchange, symbol, positions=None):
         self.exchange = exchange
         self.symbol = symbol
         self.position = []
-        self.update_positions()
+        # positionsに取得済みのfetch_positionsの結果を渡すと、取得せずにそれを使う
+        if positions is None:
+            self.update_positions()
+        else:
+            self.set_positions(positions)
 
     def update_positions(self):
         try:
             response = self.exchange.fetch_positions([self.symbol])
-            positions = response
-            self.positions = []  # init self.positions
-            for position in positions:
-                if position['entryPrice'] is not None and \
-                   position['symbol'].split(':')[0].replace("/", "") == self.exchange.market_id(self.symbol).replace("/", ""):
-                    self.positions.append(position)
+            self.set_positions(response)
         except Exception as e:
             print(f"An error occurred while fetching positions: {e}")
 
+    def set_positions(self, positions):
+        self.positions = []  # init self.positions
+        for position in positions:
+            if position['entryPrice'] is not None and \
+               position['symbol'].split(':')[0].replace("/", "") == self.exchange.market_id(self.symbol).replace("/", ""):
+                self.positions.append(position)
+
     def get_position_pnl(self, positions):
         for position in positions:
             if position is not None:
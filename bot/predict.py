@@ -1,11 +1,19 @@
+import os
+import sys
 import pickle
 import pandas as pd
-import numpy as np
-import talib
+
+# 特徴量の定義は学習側と共有する(train/feature_pipeline.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'train'))
+from feature_pipeline import FeaturePipeline, live_spec
 
 class Predictor:
     def __init__(self, config):
         self.model_path = config.get("model", "model_path")
+        # モデルが使う特徴量(カンマ区切り、時間足のprefixなし)。未指定なら全て計算する
+        features = config.get("model", "features", fallback="")
+        columns = [name.strip() for name in features.split(",") if name.strip()] or None
+        self.pipeline = FeaturePipeline(live_spec(), columns)
 
         # Load model
         with open(self.model_path, "rb") as f:
@@ -15,7 +23,7 @@ class Predictor:
         processed_dfs = []
         for df in dfs:
             prefix = df.columns[0].split('_')[0]
-            processed_df = feature_engineering(df, prefix)
+            processed_df = feature_engineering(df, prefix, self.pipeline)
             processed_df = create_label(processed_df, prefix)
             # Resample to 1m timeframe
             df_resampled = processed_df.resample('1T').asfreq()
@@ -53,10 +61,6 @@ def create_label(df, prefix, lookbehind=1):
     df = df.fillna(method='ffill')
     return df
 
-def log_transform_feature(X):
-    X[X <= 0] = np.finfo(float).eps
-    return np.log(X)
-
 def support_resistance(df, prefix, window=200):
     high = df[f'{prefix}_high']
     low = df[f'{prefix}_low']
@@ -72,34 +76,12 @@ def price_relation(df, short_prefix, long_prefix):
     df[f'{short_prefix}_close_to_{long_prefix}_resistance'] = (short_close - long_resistance) / long_resistance
     return df
 
-def feature_engineering(df, prefix):
-    open = df[f'{prefix}_open'].values
-    high = df[f'{prefix}_high'].values
-    low = df[f'{prefix}_low'].values
-    close = df[f'{prefix}_close'].values
-    volume = df[f'{prefix}_volume'].values
-    hilo = (high + low) / 2
-
-    df[f'{prefix}_RSI_ST'] = talib.RSI(close)/close
-    df[f'{prefix}_RSI_LOG'] = log_transform_feature(talib.RSI(close))
-    df[f'{prefix}_MACD'], _, _ = talib.MACD(close)
-    df[f'{prefix}_MACD_ST'], _, _ = talib.MACD(close)/close
-    df[f'{prefix}_ATR'] = talib.ATR(high, low, close)
-    df[f'{prefix}_ADX'] = talib.ADX(high, low, close, timeperiod=14)
-    df[f'{prefix}_ADXR'] = talib.ADXR(high, low, close, timeperiod=14)
-    
-    df[f'{prefix}_SMA20'] = talib.SMA(close, timeperiod=20)
-    df[f'{prefix}_SMA50'] = talib.SMA(close, timeperiod=50)
-    df[f'{prefix}_SMA200'] = talib.SMA(close, timeperiod=200)
-    
-    df[f'{prefix}_BB_UPPER'], df[f'{prefix}_BB_MIDDLE'], df[f'{prefix}_BB_LOWER'] = talib.BBANDS(close)
-    df[f'{prefix}_BBANDS_upperband'] = (df[f'{prefix}_BB_UPPER'] - hilo) / close
-    df[f'{prefix}_BBANDS_middleband'] = (df[f'{prefix}_BB_MIDDLE'] - hilo) / close
-    df[f'{prefix}_BBANDS_lowerband'] = (df[f'{prefix}_BB_LOWER'] - hilo) / close
-    df[f'{prefix}_STOCH_K'], df[f'{prefix}_STOCH_D'] = talib.STOCH(high, low, close)/close
-    df[f'{prefix}_MON'] = talib.MOM(close, timeperiod=5)
-    df[f'{prefix}_OBV'] = talib.OBV(close, volume)
+def feature_engineering(df, prefix, pipeline=None):
+    # 入力は{prefix}_closeなどの列、出力も{prefix}_RSI_STなどの列
+    if pipeline is None:
+        pipeline = FeaturePipeline(live_spec())
+    df = pipeline.transform(df, prefix=f'{prefix}_')
 
     df = df.fillna(method='ffill')
 
-    return df
\ No newline at end of file
+    return df
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+
+# ccxtの呼び出しと署名付きREST(BybitClient)で共有するレート制限
+# Bybit v5の制限は、IPごと(すべてのリクエスト: 5秒で600回)と、UIDごとのエンドポイントの種類ごとの2段なので、
+# リクエストは'ip'と種類('order', 'position', 'account')の両方の枠を使う(公開APIは'ip'だけ)
+# 枠はスライディングウィンドウで数える。直近window秒に送った時刻を覚えておき、limit回に達していれば
+# 最も古いものがwindow秒より前になるまで待つので、どのwindow秒を切り取ってもlimit回を超えない
+# (トークンバケットだと満杯の容量 + 補充分 = capacity + rate * window 回まで通ってしまう)
+# 枠を取ってから実際に送るまでの遅れで取引所側の間隔が詰まらないよう、windowにmargin秒を足して数える
+# 'ip'の枠を待っているリクエストがあるときは、優先度の高い順(注文 > ポジション・残高 > 相場)に通す
+# 自分の種類の枠(注文は1秒10回など)を待っているだけのリクエストには譲らない
+# さらに相場の取得は'ip'の枠のうちreserve回分を使わずに残すので、相場で枠が埋まっていても注文はすぐに通る
+# ccxtには attach() で fetch2 を包んで入れる(ccxt自身のenableRateLimitは二重になるので切る)
+#
+# usage:
+#   limiter = RateLimiter()
+#   limiter.attach(exchange)                       # ccxt (sync / async_support どちらでも)
+#   client = BybitClient(..., rate_limiter=limiter)
+#   limiter.stats()   # {'waiting': {...}, 'max_waiting': {...}, 'requests': {...}, 'waited': {...}}
+
+# {枠: (回数, 秒)}
+LIMITS = {
+    'ip': (600, 5),
+    'order': (10, 1),
+    'position': (10, 1),
+    'account': (10, 1),
+}
+
+# 優先度(小さいほど先)
+PRIORITY = {'order': 0, 'position': 1, 'account': 1, 'market': 2}
+
+def endpoint_class(path):
+    # "v5/order/create" や "/v5/position/switch-mode" を種類に分ける
+    parts = path.strip('/').split('/')
+    group = parts[1] if len(parts) > 1 else parts[0]
+    if group == 'order':
+        return 'order'
+    if group == 'position':
+        return 'position'
+    if group in ('account', 'asset'):
+        return 'account'
+    return 'market'
+
+class SlidingWindow:
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.sent = deque()  # 直近window秒に送った時刻
+
+    def wait_time(self, now, reserve=0):
+        # 1回送れるようになるまでの秒数。reserve回分は残しておく
+        while self.sent and self.sent[0] <= now - self.window:
+            self.sent.popleft()
+        limit = self.limit - reserve
+        if len(self.sent) < limit:
+            return 0
+        return self.sent[len(self.sent) - limit] + self.window - now
+
+    def take(self, now):
+        self.sent.append(now)
+
+class RateLimiter:
+    def __init__(self, limits=LIMITS, reserve=50, margin=0.05, poll=0.005):
+        self.windows = {name: SlidingWindow(limit, window + margin) for name, (limit, window) in limits.items()}
+        self.reserve = reserve  # 相場の取得が使わずに残す'ip'の回数(注文は1秒10回なので5秒で50回)
+        self.poll = poll
+        self.lock = threading.Lock()
+        self.ip_blocked = {}  # {待っているリクエスト: 優先度}。自分の種類の枠は空いていて'ip'だけを待っているもの
+        self.waiting = Counter()  # 優先度ごとの待っている数
+        self.max_waiting = Counter()
+        self.requests = Counter()  # 種類ごとの回数
+        self.waited = Counter()  # 種類ごとの待った秒数の合計
+
+    def _enter(self, lane):
+        with self.lock:
+            priority = PRIORITY[lane]
+            self.waiting[priority] += 1
+            self.max_waiting[priority] = max(self.max_waiting[priority], self.waiting[priority])
+
+    def _leave(self, lane, ticket, start):
+        with self.lock:
+            self.ip_blocked.pop(ticket, None)
+            self.waiting[PRIORITY[lane]] -= 1
+            self.requests[lane] += 1
+            self.waited[lane] += time.monotonic() - start
+
+    def _try(self, lane, ticket):
+        # 取れたら0、取れなければ次に試すまでの秒数
+        with self.lock:
+            now = time.monotonic()
+            own = self.windows.get(lane)
+            own_wait = own.wait_time(now) if own is not None else 0
+            if own_wait > 0:
+                # 自分の種類の枠を待っている間は、'ip'を他の種類に譲る
+                self.ip_blocked.pop(ticket, None)
+                return own_wait
+            ip = self.windows.get('ip')
+            ip_wait = ip.wait_time(now, self.reserve if lane == 'market' else 0) if ip is not None else 0
+            priority = PRIORITY[lane]
+            ahead = any(p < priority for t, p in self.ip_blocked.items() if t is not ticket)
+            if ip_wait > 0 or ahead:
+                self.ip_blocked[ticket] = priority
+                return max(ip_wait, self.poll)
+            self.ip_blocked.pop(ticket, None)
+            for window in (ip, own):
+                if window is not None:
+                    window.take(now)
+            return 0
+
+    def acquire(self, lane):
+        start = time.monotonic()
+        ticket = object()
+        self._enter(lane)
+        try:
+            wait = self._try(lane, ticket)
+            while wait > 0:
+                time.sleep(wait)
+                wait = self._try(lane, ticket)
+        finally:
+            self._leave(lane, ticket, start)
+
+    async def acquire_async(self, lane):
+        start = time.monotonic()
+        ticket = object()
+        self._enter(lane)
+        try:
+            wait = self._try(lane, ticket)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._try(lane, ticket)
+        finally:
+            self._leave(lane, ticket, start)
+
+    def attach(self, exchange):
+        fetch2 = exchange.fetch2
+        if asyncio.iscoroutinefunction(fetch2):
+            async def limited(path, *args, **kwargs):
+                await self.acquire_async(endpoint_class(path))
+                return await fetch2(path, *args, **kwargs)
+        else:
+            def limited(path, *args, **kwargs):
+                self.acquire(endpoint_class(path))
+                return fetch2(path, *args, **kwargs)
+        exchange.fetch2 = limited
+        exchange.enableRateLimit = False
+        return exchange
+
+    def stats(self):
+        with self.lock:
+            return {
+                'waiting': dict(self.waiting),
+                'max_waiting': dict(self.max_waiting),
+                'requests': dict(self.requests),
+                'waited': dict(self.waited),
+            }
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+import numpy as np
+import pandas as pd
+import websockets
+from candle_store import AsyncCandleStore
+from kline_stream import KlineStream
+
+# 記録したローソク足をローカルのWebSocketサーバーから再生して、KlineStreamを確かめる
+# RESTの取得(埋め直し)も同じ記録から返すので、取引所にはつながない
+# 確かめること:
+#   1. 足が確定したら、その足までのDataFrameでon_closeが呼ばれる
+#   2. 接続中にメッセージが抜けたら、RESTで埋め直して抜けた足も確定として扱う
+#   3. 再接続したら切れていた間の足を埋め直し、同じ足を2回on_closeに渡さない
+# usage: python replay_kline_stream.py                       # 乱数で作った足
+#        python replay_kline_stream.py --csv ../csv/BTCUSDT_1m_20210801_20221231.csv
+
+TIMEFRAME_MS = 60000
+TOPIC = "kline.1.BTCUSDT"
+
+def load_candles(csv_path, rows, seed=0):
+    # [timestamp(ms), open, high, low, close, volume] のリスト
+    if csv_path:
+        df = pd.read_csv(csv_path, nrows=rows)
+        timestamps = pd.to_datetime(df['timestamp']).astype('int64') // 10 ** 6
+        values = df[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)
+        return [[int(t)] + list(v) for t, v in zip(timestamps, values)]
+    rng = np.random.default_rng(seed)
+    close = 30000 + rng.standard_normal(rows).cumsum() * 10
+    base = 1_600_000_000_000
+    return [[base + i * TIMEFRAME_MS, close[i] - 1, close[i] + 5, close[i] - 5, close[i], float(rng.integers(1, 100))]
+            for i in range(rows)]
+
+class RecordedExchange:
+    # RESTの代わり。currentが形成中の足で、それより後の足はまだ存在しない
+    def __init__(self, candles, current):
+        self.candles = candles
+        self.current = current
+
+    def parse_timeframe(self, timeframe):
+        return TIMEFRAME_MS // 1000
+
+    def milliseconds(self):
+        return self.candles[self.current][0] + 1000
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        candles = self.candles[:self.current + 1]
+        if since is None:
+            return candles[-limit:]
+        return [c for c in candles if c[0] >= since][:limit]
+
+def kline_message(candle, confirm):
+    return json.dumps({"topic": TOPIC, "type": "snapshot", "data": [{
+        "start": candle[0], "end": candle[0] + TIMEFRAME_MS - 1, "interval": "1",
+        "open": str(candle[1]), "high": str(candle[2]), "low": str(candle[3]),
+        "close": str(candle[4]), "volume": str(candle[5]), "confirm": confirm}]})
+
+class Replay:
+    # 接続ごとの筋書き
+    #   1回目: start..first_end を再生して切る(ハンドラから戻ると接続が閉じる)
+    #   2回目: 切れていた間に足が進んでいる。最初に1回目の最後の確定足をもう一度送り、gapの足は送らない
+    def __init__(self, exchange, start, first_end, resume, gap, end, pace):
+        self.exchange = exchange
+        self.start = start
+        self.first_end = first_end
+        self.resume = resume
+        self.gap = gap
+        self.end = end
+        self.pace = pace
+        self.connections = 0
+        self.done = asyncio.Event()
+
+    async def send(self, ws, i):
+        self.exchange.current = i
+        candle = self.exchange.candles[i]
+        await ws.send(kline_message(candle, False))
+        await ws.send(kline_message(candle, True))
+        await asyncio.sleep(self.pace)
+
+    async def handler(self, ws):
+        subscribe = json.loads(await ws.recv())
+        if subscribe.get("args") != [TOPIC]:
+            raise RuntimeError(f"unexpected subscription: {subscribe}")
+        self.connections += 1
+        if self.connections == 1:
+            self.exchange.current = self.start
+            await ws.send(json.dumps({"success": True, "op": "subscribe"}))
+            await asyncio.sleep(self.pace)
+            for i in range(self.start, self.first_end + 1):
+                await self.send(ws, i)
+        elif self.connections == 2:
+            self.exchange.current = self.resume
+            await ws.send(json.dumps({"success": True, "op": "subscribe"}))
+            await asyncio.sleep(self.pace)
+            await ws.send(kline_message(self.exchange.candles[self.first_end], True))  # Already emitted
+            for i in range(self.resume, self.end + 1):
+                if i != self.gap:
+                    await self.send(ws, i)
+            self.done.set()
+            await ws.wait_closed()
+
+def check(failures, condition, message):
+    print(f"{'ok' if condition else 'FAILED':8}{message}")
+    if not condition:
+        failures.append(message)
+
+async def run(args):
+    candles = load_candles(args.csv, args.start + 60)
+    start = args.start
+    first_end = start + 10
+    resume = first_end + 4  # first_end+1 .. resume-1 は切れていた間に確定する
+    gap = resume + 5
+    end = resume + 15
+    exchange = RecordedExchange(candles, start)
+    replay = Replay(exchange, start, first_end, resume, gap, end, args.pace_ms / 1000)
+
+    emitted = []
+    mismatched = []
+
+    async def on_close(df):
+        timestamp = df.index[-1].value // 10 ** 6
+        emitted.append(timestamp)
+        last = (timestamp - candles[0][0]) // TIMEFRAME_MS
+        expected = np.array([c[1:] for c in candles[last + 1 - len(df):last + 1]])
+        if not np.array_equal(df.to_numpy(), expected):
+            mismatched.append(timestamp)
+
+    async with websockets.serve(replay.handler, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        store = AsyncCandleStore(exchange, limit=500)
+        stream = KlineStream(store, "BTC/USDT", "1m", on_close, url=f"ws://127.0.0.1:{port}",
+                             ping_interval=args.pace_ms / 1000 * 20, reconnect_delay=0.05)
+        task = asyncio.create_task(stream.run())
+        await asyncio.wait_for(replay.done.wait(), 30)
+        await asyncio.sleep(args.pace_ms / 1000 * 2)
+        task.cancel()
+
+    index = [(t - candles[0][0]) // TIMEFRAME_MS for t in emitted]
+    failures = []
+    print(f"emitted candles: {index}")
+    check(failures, not mismatched, "every on_close frame matches the recorded candles")
+    check(failures, set(range(start, first_end + 1)) <= set(index),
+          "each confirmed candle is emitted when it closes")
+    check(failures, gap in index and stream.backfills >= 3,
+          f"the skipped candle {gap} is backfilled over REST and emitted")
+    check(failures, resume - 1 in index and stream.reconnects >= 1,
+          "after reconnecting, candles missed while disconnected are backfilled")
+    check(failures, index == sorted(set(index)), "no candle is emitted twice")
+    ring = store.frame("BTC/USDT", "1m")
+    check(failures, np.array_equal(ring.to_numpy(), np.array([c[1:] for c in candles[:end + 1]][-len(ring):])),
+          "the candle store holds every recorded candle up to the last one")
+    if failures:
+        raise SystemExit(f"{len(failures)} check(s) failed")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', default=None)
+    parser.add_argument('--start', type=int, default=600)
+    parser.add_argument('--pace-ms', type=float, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
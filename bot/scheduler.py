@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import deque
+import numpy as np
+
+# 取引所の足の切り替わり(境界)からdelay_msだけ後に起こすスケジューラ
+# 固定のsleep(60)だと処理時間の分だけずれていくので、毎回次の境界までの残り時間を計算して待つ
+# 時計は取引所のサーバー時刻とのずれ(offset)を推定して合わせる(往復時間が最も短いサンプルを使う)
+# 処理が長引いて境界を過ぎたときは、過ぎた分をまとめて次の境界で1回だけ動かす(skippedに数える)
+# 境界から起きるまでの遅れ(wake)と、処理が終わるまでの遅れ(done)を記録する
+#
+# usage:
+#   scheduler = CandleScheduler(exchange, "1m", delay_ms=50)
+#   while True:
+#       tick = scheduler.wait()      # 次の足の境界 + 50msまで待つ
+#       ...                          # 取得・判断・発注
+#       scheduler.done(tick)
+#   scheduler.stats()                # {'wake_p50': ..., 'done_p99': ..., 'skipped': ...}
+
+class CandleScheduler:
+    def __init__(self, exchange, timeframe="1m", delay_ms=50, resync_interval=3600, samples=5, history=1000):
+        self.exchange = exchange
+        self.period_ms = exchange.parse_timeframe(timeframe) * 1000
+        self.delay_ms = delay_ms
+        self.resync_interval = resync_interval  # 秒
+        self.samples = samples
+        self.offset_ms = 0.0  # サーバー時刻 - ローカル時刻
+        self.synced_at = None
+        self.last_tick = None
+        self.skipped = 0
+        self.wake = deque(maxlen=history)  # 境界から起きるまでのms
+        self.latency = deque(maxlen=history)  # 境界から処理が終わるまでのms
+
+    def now_ms(self):
+        return time.time() * 1000 + self.offset_ms
+
+    def _measure(self, server_ms, start, end):
+        # (往復時間, ずれ)。サーバー時刻は往復の中間で取られたとみなす
+        return end - start, server_ms - (start + end) / 2
+
+    def _update_offset(self, measurements):
+        if measurements:
+            self.offset_ms = min(measurements)[1]
+        self.synced_at = time.monotonic()
+
+    def _needs_sync(self):
+        return self.synced_at is None or time.monotonic() - self.synced_at > self.resync_interval
+
+    def sync_clock(self):
+        measurements = []
+        for _ in range(self.samples):
+            start = time.time() * 1000
+            server_ms = self.exchange.fetch_time()
+            measurements.append(self._measure(server_ms, start, time.time() * 1000))
+        self._update_offset(measurements)
+
+    def _next_tick(self):
+        # 次の境界。前回から2本以上離れていれば、その間の境界は飛ばしたことになる
+        tick = (self.now_ms() - self.delay_ms) // self.period_ms * self.period_ms + self.period_ms
+        if self.last_tick is not None and tick - self.last_tick > self.period_ms:
+            self.skipped += int((tick - self.last_tick) // self.period_ms) - 1
+        return tick
+
+    def _sleep_time(self, tick):
+        return max(tick + self.delay_ms - self.now_ms(), 0) / 1000
+
+    def _woke(self, tick):
+        self.last_tick = tick
+        self.wake.append(self.now_ms() - tick)
+        return tick
+
+    def wait(self):
+        if self._needs_sync():
+            try:
+                self.sync_clock()
+            except Exception as e:
+                print(f"Clock sync failed, keeping offset {self.offset_ms:.1f} ms: {e}")
+                self.synced_at = time.monotonic()
+        tick = self._next_tick()
+        # sleepは長めに起きることがあるので、残りを計算し直しながら待つ
+        while self._sleep_time(tick) > 0:
+            time.sleep(self._sleep_time(tick))
+        return self._woke(tick)
+
+    def done(self, tick):
+        latency = self.now_ms() - tick
+        self.latency.append(latency)
+        print(f"Tick {tick:.0f}: woke +{self.wake[-1]:.1f} ms, done +{latency:.1f} ms")
+
+    def stats(self):
+        stats = {'skipped': self.skipped, 'offset_ms': self.offset_ms}
+        for name, values in (('wake', self.wake), ('done', self.latency)):
+            if values:
+                p50, p99 = np.percentile(values, [50, 99])
+                stats.update({f'{name}_p50': p50, f'{name}_p99': p99, f'{name}_max': max(values)})
+        return stats
+
+class AsyncCandleScheduler(CandleScheduler):
+    # ccxt.async_support の取引所オブジェクト用
+    async def sync_clock(self):
+        measurements = []
+        for _ in range(self.samples):
+            start = time.time() * 1000
+            server_ms = await self.exchange.fetch_time()
+            measurements.append(self._measure(server_ms, start, time.time() * 1000))
+        self._update_offset(measurements)
+
+    async def wait(self):
+        if self._needs_sync():
+            try:
+                await self.sync_clock()
+            except Exception as e:
+                print(f"Clock sync failed, keeping offset {self.offset_ms:.1f} ms: {e}")
+                self.synced_at = time.monotonic()
+        tick = self._next_tick()
+        while self._sleep_time(tick) > 0:
+            await asyncio.sleep(self._sleep_time(tick))
+        return self._woke(tick)
@@ -0,0 +1,89 @@
+import pandas as pd
+from indicators import IndicatorEngine, SMA, ATR
+
+# 銘柄ごとの売買の状態(ポートフォリオと指標)と判断
+# Tradeは1銘柄分を、MultiSymbolTradeは銘柄ごとに1つずつ持つ
+#
+# usage:
+#   strategy = Strategy("BTC/USDT", qty=0.008)
+#   df = strategy.prepare_data(df)
+#   action = strategy.decide_trade_action(long_positions, short_positions, df)
+
+class Strategy:
+    def __init__(self, market_symbol, qty):
+        self.market_symbol = market_symbol  # ccxtのシンボル("BTC/USDT")
+        self.symbol = market_symbol.replace("/", "")  # Bybitのシンボル("BTCUSDT")
+        self.qty = qty
+        self.portfolio = {
+            'position': None,  # "long" or "short"
+            'entry_price': None,
+            'entry_point': 0,
+            'trailing_stop': 0
+        }
+        # 確定した足ごとに1本ずつ更新する指標。ATRは従来のta.volatility.AverageTrueRangeと同じ計算
+        self.indicators = IndicatorEngine({
+            'SMA20': SMA(20),
+            'ATR': ATR(210, style='ta'),
+        }, history=500)
+
+    def prepare_data(self, df, forming=True):
+        # forming=Trueなら最後の行は形成中の足。確定した足のうち、まだ指標に流していないものだけで更新する
+        # (ストリーミングでは足の確定時に呼ぶので、すべて確定した足)
+        engine = self.indicators
+        closed = df.iloc[:-1] if forming else df
+        # 前回の足が取得した範囲より前なら(長く止まっていたなど)、途中の足が抜けているので最初から計算し直す
+        if engine.last_timestamp is not None and (len(closed) == 0 or engine.last_timestamp < closed.index[0]):
+            engine.reset()
+        new = closed if engine.last_timestamp is None else closed[closed.index > engine.last_timestamp]
+        for timestamp, candle in new.iterrows():
+            engine.update(timestamp, candle)
+
+        indicators = engine.frame(df.index)
+        if forming:
+            indicators.iloc[-1] = pd.Series(engine.peek(df.iloc[-1]))
+        for name in engine.names:
+            df[name] = indicators[name]
+
+        return df
+
+    def decide_trade_action(self, long_positions, short_positions, df):
+        i = df.index[-1]
+        atr = df.loc[i, 'ATR']
+        close = df.loc[i, 'close']
+        ma = df.loc[i, 'SMA20']
+
+        prev_close = df.loc[df.index[-2], 'close'] if len(df) > 1 else None
+        prev_ma = df.loc[df.index[-2], 'SMA20'] if len(df) > 1 else None
+
+        # 利確と損切りの閾値
+        TAKE_PROFIT = atr * 1 + (close * 0.001) 
+        STOP_LOSS = atr * -1
+
+        print(f"{self.symbol} Timestamp: {i}, ATR: {atr:.2f}, Close: {close:.2f}, SMA20: {ma:.2f}, Prev Close: {prev_close:.2f}, Prev SMA20: {prev_ma:.2f}")
+
+        if len(long_positions) > 0:
+            self.portfolio['trailing_stop'] = max(self.portfolio['trailing_stop'], close - STOP_LOSS) if 'trailing_stop' in self.portfolio else close - STOP_LOSS
+            profit = (close - self.portfolio['entry_price']) * (1 - self.commission_rate)
+            if profit > TAKE_PROFIT or close < self.portfolio['trailing_stop']:
+                return 'exit_long'
+            else:
+                return None
+        elif len(short_positions) > 0:
+            self.portfolio['trailing_stop'] = min(self.portfolio['trailing_stop'], close + STOP_LOSS) if 'trailing_stop' in self.portfolio else close + STOP_LOSS
+            profit = (self.portfolio['entry_price'] - close) * (1 - self.commission_rate)
+            if profit > TAKE_PROFIT or close > self.portfolio['trailing_stop']:
+                return 'exit_short'
+            else:
+                return None
+        elif prev_close is not None and prev_ma is not None \
+            and prev_close < prev_ma and close > ma:
+                self.portfolio['trailing_stop'] = 0
+                self.portfolio['entry_price'] = close
+                return "entry_long"
+        elif prev_close is not None and prev_ma is not None \
+            and prev_close > prev_ma and close < ma:
+                self.portfolio['trailing_stop'] = 0
+                self.portfolio['entry_price'] = close
+                return 'entry_short'
+        else:
+            return None
@@ -1,53 +1,59 @@
 import ccxt
-import pandas as pd
-import requests
-import time
-import hmac
 import uuid
-import hashlib
-import json
-from urllib.parse import urlencode
 from position_manager import PositionManager
 from discord_notifier import DiscordNotifier
 from account import Account
 from logger import Logger
-from ta.volatility import AverageTrueRange
+from strategy import Strategy
+from candle_store import CandleStore
+from bybit_client import BybitClient
+from account_state import AccountState
+from rate_limiter import RateLimiter
 
 class Trade:
-    def __init__(self, config):
+    candle_store_class = CandleStore
+    account_state_class = AccountState
+
+    def __init__(self, config, notifier=None):
         self.api_key = config.get("exchange", "api_key")
         self.secret_key = config.get("exchange", "secret_key")
         self.exchange_name = config.get("exchange", "exchange_name")
         self.first_run = True
-        self.portfolio = {
-            'position': None,  # "long" or "short"
-            'entry_price': None,
-            'entry_point': 0,
-            'trailing_stop': 0
-        }
+        # 銘柄ごとの状態(ポートフォリオと指標)
+        self.strategy = Strategy("BTC/USDT", qty=0.008)
+
+        # ccxtと署名付きRESTで同じレート制限を使う
+        self.rate_limiter = RateLimiter()
 
         # Initialize exchange
-        self.exchange = getattr(ccxt, self.exchange_name)({
-            "apiKey": self.api_key,
-            "secret": self.secret_key,
-            "enableRateLimit": True,
-            'options': {'defaultType': 'linear'}
-        })
+        self.exchange = self.create_exchange()
+
+        # 前回までの足を保持し、新しい足だけを取得する
+        self.candles = self.candle_store_class(self.exchange, limit=500)
 
         self.logger = Logger("trade")
-        self.discord_notifier = DiscordNotifier(config)
+        # Discordの通知はmainと同じものを使う(キューとレート制限の状態をプロセスで1つにする)
+        # 渡されなければ自分で作り、close()で止める
+        self.owns_notifier = notifier is None
+        self.discord_notifier = DiscordNotifier(config) if notifier is None else notifier
         self.account = Account(self.exchange)
+        # 残高とポジションはstate_ttl秒のあいだ使い回し、発注したら取り直す
+        self.state = self.account_state_class(self.exchange, self.strategy.symbol, ttl=config.getfloat("bot", "state_ttl", fallback=300))
         self.recv_window=str(10000)
         self.url="https://api.bybit.com"
         # self.url="https://api-testnet.bybit.com" 
-        self.mode = self.set_position_mode(0)
-        self.qty = 0.008
+        # 署名付きのリクエストは接続を使い回す
+        self.client = BybitClient(
+            self.api_key, self.secret_key, self.url, recv_window=self.recv_window,
+            timeout=(config.getfloat("exchange", "connect_timeout", fallback=3.05),
+                     config.getfloat("exchange", "read_timeout", fallback=10)),
+            retries=config.getint("exchange", "retries", fallback=2),
+            pool_maxsize=config.getint("exchange", "pool_maxsize", fallback=4),
+            rate_limiter=self.rate_limiter)
+        self.mode = self.set_position_modes()
 
     def get_ohlcv(self, timeframe):
-        ohlcv = self.exchange.fetch_ohlcv("BTC/USDT", timeframe, limit=500)
-        df = pd.DataFrame(ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"])
-        df.set_index(pd.to_datetime(df["timestamp"], unit="ms"), inplace=True)
-        df.drop(columns=["timestamp"], inplace=True)
+        df = self.candles.fetch(self.strategy.market_symbol, timeframe)
         # df.columns = [f"{timeframe}_{col}" for col in df.columns]
         return df
 
@@ -60,42 +66,53 @@ class Trade:
         # self.logger().info("get market data.")
         # return ohlcv_data
     
-    def prepare_data(self, df):
-        # Calculate moving averages
-        df['SMA20'] = df['close'].rolling(window=20).mean()
-
-        average_true_range = AverageTrueRange(
-            high=df['high'],
-            low=df['low'],
-            close=df['close'],
-            window=210
-        )
-        df['ATR'] = average_true_range.average_true_range()
+    def prepare_data(self, df, forming=True):
+        return self.strategy.prepare_data(df, forming)
 
-        return df
+    def create_exchange(self, module=ccxt):
+        exchange = getattr(module, self.exchange_name)({
+            "apiKey": self.api_key,
+            "secret": self.secret_key,
+            "enableRateLimit": True,
+            'options': {'defaultType': 'linear'}
+        })
+        return self.rate_limiter.attach(exchange)
 
     def execute_trade(self, df):
         self.check_balance()
         # Execute trade based on prediction here
-        position_manager = PositionManager(self.exchange, "BTCUSDT")
+        position_manager = PositionManager(self.exchange, self.strategy.symbol, self.state.positions())
         long_positions, short_positions = position_manager.separate_positions_by_side()
 
-        amount = self.qty
-        result = None
-
         action = self.decide_trade_action(long_positions, short_positions, df)
+        result = self.order_for_action(action)
+        return self.trade_message(action, result)
+
+    def order_for_action(self, action, strategy=None):
+        strategy = strategy or self.strategy
+        amount = strategy.qty
+        result = None
 
+        # 決済はreduceOnlyにする。キャッシュしたポジションが古く(清算・手動決済・TP/SLで)既に閉じていても、
+        # 反対側に新しいポジションを持たずに取引所で拒否される
         if action == "entry_long":
-            result = self.place_order("BTCUSDT", "Buy", amount)
+            result = self.place_order(strategy.symbol, "Buy", amount)
         elif action == "entry_short":
-            result = self.place_order("BTCUSDT", "Sell", amount)
+            result = self.place_order(strategy.symbol, "Sell", amount)
         elif action == "exit_short":
-            result = self.place_order("BTCUSDT", "Buy", amount)
+            result = self.place_order(strategy.symbol, "Buy", amount, reduce_only=True)
         elif action == "exit_long":
-            result = self.place_order("BTCUSDT", "Sell", amount)
+            result = self.place_order(strategy.symbol, "Sell", amount, reduce_only=True)
         elif action == None:
             pass
 
+        if action is not None:
+            # 約定したかどうかにかかわらず、残高とポジションを取り直す
+            self.state.invalidate()
+
+        return result
+
+    def trade_message(self, action, result):
         message = f"{action}: "
 
         if result is True:
@@ -109,48 +126,9 @@ class Trade:
         return message
     
     def decide_trade_action(self, long_positions, short_positions, df):
-        i = df.index[-1]
-        atr = df.loc[i, 'ATR']
-        close = df.loc[i, 'close']
-        ma = df.loc[i, 'SMA20']
-
-        prev_close = df.loc[df.index[-2], 'close'] if len(df) > 1 else None
-        prev_ma = df.loc[df.index[-2], 'SMA20'] if len(df) > 1 else None
-
-        # 利確と損切りの閾値
-        TAKE_PROFIT = atr * 1 + (close * 0.001) 
-        STOP_LOSS = atr * -1
-
-        print(f"Timestamp: {i}, ATR: {atr:.2f}, Close: {close:.2f}, SMA20: {ma:.2f}, Prev Close: {prev_close:.2f}, Prev SMA20: {prev_ma:.2f}")
+        return self.strategy.decide_trade_action(long_positions, short_positions, df)
 
-        if len(long_positions) > 0:
-            self.portfolio['trailing_stop'] = max(self.portfolio['trailing_stop'], close - STOP_LOSS) if 'trailing_stop' in self.portfolio else close - STOP_LOSS
-            profit = (close - self.portfolio['entry_price']) * (1 - self.commission_rate)
-            if profit > TAKE_PROFIT or close < self.portfolio['trailing_stop']:
-                return 'exit_long'
-            else:
-                return None
-        elif len(short_positions) > 0:
-            self.portfolio['trailing_stop'] = min(self.portfolio['trailing_stop'], close + STOP_LOSS) if 'trailing_stop' in self.portfolio else close + STOP_LOSS
-            profit = (self.portfolio['entry_price'] - close) * (1 - self.commission_rate)
-            if profit > TAKE_PROFIT or close > self.portfolio['trailing_stop']:
-                return 'exit_short'
-            else:
-                return None
-        elif prev_close is not None and prev_ma is not None \
-            and prev_close < prev_ma and close > ma:
-                self.portfolio['trailing_stop'] = 0
-                self.portfolio['entry_price'] = close
-                return "entry_long"
-        elif prev_close is not None and prev_ma is not None \
-            and prev_close > prev_ma and close < ma:
-                self.portfolio['trailing_stop'] = 0
-                self.portfolio['entry_price'] = close
-                return 'entry_short'
-        else:
-            return None
-
-    def place_order(self, symbol, side, amount):
+    def place_order(self, symbol, side, amount, reduce_only=False):
         endpoint="/v5/order/create"
         method="POST"
         orderLinkId=uuid.uuid4().hex
@@ -164,28 +142,13 @@ class Trade:
             "orderLinkId": orderLinkId,
             "positionIdx": 0 # one-way mode
         }
+        if reduce_only:
+            params["reduceOnly"] = True
         return self.http_request(endpoint, method, params, "Order")   
     
     def http_request(self, endpoint, method, params, info):
         try:
-            httpClient = requests.Session()
-            global time_stamp
-            time_stamp = str(int(time.time() * 10 ** 3))
-            payload = json.dumps(params)
-            signature = self.genSignature(payload)
-            headers = {
-                'X-BAPI-API-KEY': self.api_key,
-                'X-BAPI-SIGN': signature,
-                'X-BAPI-SIGN-TYPE': '2',
-                'X-BAPI-TIMESTAMP': time_stamp,
-                'X-BAPI-RECV-WINDOW': self.recv_window,
-                'Content-Type': 'application/json'
-            }
-            if method == "POST":
-                response = httpClient.request(method, self.url + endpoint, headers=headers, data=payload)
-            else:
-                payload = urlencode(params)
-                response = httpClient.request(method, self.url + endpoint + '?' + payload, headers=headers)
+            response = self.client.request(method, endpoint, params)
 
             if response.status_code == 200:
                 if response.text:
@@ -218,12 +181,16 @@ class Trade:
         else:
             return order_book['ask'][0][0]
         
-    def set_position_mode(self, mode):
+    def set_position_modes(self):
+        # 売買する銘柄をすべて片方向(one-way)モードにする
+        return self.set_position_mode(0, self.strategy.symbol)
+
+    def set_position_mode(self, mode, symbol):
         endpoint = "/v5/position/switch-mode"
         method = "POST"
         params = {
             "category": "linear",
-            "symbol": "BTCUSDT",
+            "symbol": symbol,
             "coin": "USDT",
             "mode": mode  # Position mode. 0: Merged Single. 3: Both Sides
         }
@@ -231,10 +198,4 @@ class Trade:
         return response
         
     def check_balance(self):
-        self.account.get_balance()
-
-    def genSignature(self, payload):
-        param_str= str(time_stamp) + self.api_key + self.recv_window + payload
-        hash = hmac.new(bytes(self.secret_key, "utf-8"), param_str.encode("utf-8"),hashlib.sha256)
-        signature = hash.hexdigest()
-        return signature
\ No newline at end of file
+        self.account.report(self.state.balance(), self.state.margin_balance())
\ No newline at end of file
@@ -0,0 +1,184 @@
+import queue
+import random
+import time
+import numpy as np
+import torch
+import pandas as pd
+import torch.multiprocessing as mp
+from qnetwork import QNetwork
+from trading_env_matsui import TradingEnvMatsui
+
+# 複数のアクタープロセスが環境を動かして遷移を集め、1つの学習プロセス(Agent)がリプレイで学習する
+# アクターは共有メモリ上のQNetworkの重みを定期的に読み込み、学習側はsync_intervalごとに重みを公開する
+#
+# usage:
+#   agent = Agent(env, state_size, action_size, memory=ReplayBuffer(1000000, state_size))
+#   ActorLearner(agent, df, n_actors=8).run(total_updates=100000)
+# dfの代わりにSharedDatasetを渡すと、各アクターは共有メモリにアタッチするだけでデータを複製しない
+
+def apex_epsilons(n_actors, base=0.4, alpha=7):
+    # Ape-X style fixed exploration rates, from base down to base ** (1 + alpha)
+    if n_actors == 1:
+        return [base]
+    return [base ** (1 + i / (n_actors - 1) * alpha) for i in range(n_actors)]
+
+def run_actor(actor_id, df, step_offset, env_kwargs, network_kwargs, shared_network, weights_lock, weights_version,
+              transition_queue, stop_event, epsilon, send_interval, seed):
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+
+    env = TradingEnvMatsui(df, **env_kwargs)
+    support = torch.linspace(network_kwargs['v_min'], network_kwargs['v_max'], network_kwargs['atom_size'])
+    q_network = QNetwork(support=support, **network_kwargs)
+    q_network.eval()
+    version = -1
+
+    transitions = ([], [], [], [], [], [])
+    episode_rewards = []
+    state = env.reset()
+    while not stop_event.is_set():
+        # Pick up newly published weights at the start of each outgoing batch
+        if not transitions[1] and weights_version.value != version:
+            with weights_lock:
+                q_network.load_state_dict(shared_network.state_dict())
+                version = weights_version.value
+
+        if np.random.rand() <= epsilon:
+            action = random.randrange(network_kwargs['action_size'])
+        else:
+            with torch.no_grad():
+                act_values = (q_network(torch.from_numpy(state).unsqueeze(0)) * support).sum(dim=2)
+            action = int(act_values.argmax())
+
+        step = env.current_step
+        next_state, reward, done, _ = env.step(action)
+        for items, value in zip(transitions, (state, action, reward, next_state, done, step + step_offset)):
+            items.append(value)
+
+        if done:
+            episode_rewards.append(env.episode_reward)
+            state = env.reset()
+        else:
+            state = next_state
+
+        if len(transitions[1]) >= send_interval:
+            batch = tuple(np.array(items) for items in transitions)
+            # Block with a timeout so a full queue does not keep the actor alive after stop
+            while not stop_event.is_set():
+                try:
+                    transition_queue.put((actor_id, batch, episode_rewards), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            transitions = ([], [], [], [], [], [])
+            episode_rewards = []
+
+class ActorLearner:
+    def __init__(self, agent, df, n_actors=None, shard=True, sync_interval=100, send_interval=256, queue_size=64,
+                 env_kwargs=None, epsilons=None, start_method=None, seed=0):
+        self.agent = agent
+        self.df = df
+        self.n_actors = n_actors or max(1, mp.cpu_count() - 1)
+        self.shard = shard
+        self.sync_interval = sync_interval
+        self.send_interval = send_interval
+        self.queue_size = queue_size
+        self.env_kwargs = env_kwargs or {}
+        self.epsilons = epsilons or apex_epsilons(self.n_actors)
+        self.seed = seed
+        self.ctx = mp.get_context(start_method)
+
+        self.network_kwargs = {
+            'state_size': agent.state_size,
+            'action_size': agent.action_size,
+            'atom_size': agent.atom_size,
+            'v_min': agent.v_min,
+            'v_max': agent.v_max,
+        }
+        support = torch.linspace(agent.v_min, agent.v_max, agent.atom_size)
+        self.shared_network = QNetwork(support=support, **self.network_kwargs)
+        self.shared_network.share_memory()
+        self.weights_lock = self.ctx.Lock()
+        self.weights_version = self.ctx.Value('l', 0)
+
+        self.transitions = 0
+        self.updates = 0
+        self.episode_rewards = []
+
+    def _shards(self):
+        # 時系列を連続した区間に分け、各アクターに1区間ずつ割り当てる
+        if not self.shard:
+            return [(self.df, 0)] * self.n_actors
+        bounds = np.linspace(0, len(self.df), self.n_actors + 1).astype(int)
+        return [(self._slice(start, end), start) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def _slice(self, start, end):
+        if isinstance(self.df, pd.DataFrame):
+            return self.df.iloc[start:end]
+        return self.df.slice(start, end)
+
+    def publish_weights(self):
+        state_dict = {k: v.cpu() for k, v in self.agent.q_network.state_dict().items()}
+        with self.weights_lock:
+            self.shared_network.load_state_dict(state_dict)
+            self.weights_version.value += 1
+
+    def _receive(self, transition_queue, block):
+        try:
+            _, batch, episode_rewards = transition_queue.get(block=block, timeout=1.0 if block else None)
+        except queue.Empty:
+            return False
+        self.agent.memory.add_batch(*batch)
+        self.transitions += len(batch[1])
+        self.episode_rewards.extend(episode_rewards)
+        return True
+
+    def run(self, total_updates):
+        transition_queue = self.ctx.Queue(self.queue_size)
+        stop_event = self.ctx.Event()
+        self.publish_weights()
+
+        actors = []
+        for actor_id, (df, step_offset) in enumerate(self._shards()):
+            actor = self.ctx.Process(target=run_actor, daemon=True, args=(
+                actor_id, df, step_offset, self.env_kwargs, self.network_kwargs, self.shared_network,
+                self.weights_lock, self.weights_version, transition_queue, stop_event,
+                self.epsilons[actor_id], self.send_interval, self.seed + actor_id))
+            actor.start()
+            actors.append(actor)
+
+        start = time.perf_counter()
+        start_transitions = self.transitions
+        try:
+            target = self.updates + total_updates
+            while self.updates < target:
+                # Take everything the actors have sent, but never wait while there is learning to do
+                while self._receive(transition_queue, block=False):
+                    pass
+                if len(self.agent.memory) <= self.agent.batch_size:
+                    if not self._receive(transition_queue, block=True) and not any(a.is_alive() for a in actors):
+                        raise RuntimeError("all actor processes exited before the learner finished")
+                    continue
+
+                self.agent.replay()
+                self.updates += 1
+                if self.updates % self.sync_interval == 0:
+                    self.publish_weights()
+        finally:
+            stop_event.set()
+            # Drain so actors blocked on a full queue can see the stop event and exit
+            while any(actor.is_alive() for actor in actors):
+                while self._receive(transition_queue, block=False):
+                    pass
+                for actor in actors:
+                    actor.join(timeout=0.1)
+
+        elapsed = time.perf_counter() - start
+        return {
+            'updates': self.updates,
+            'transitions': self.transitions,
+            'elapsed': elapsed,
+            'updates_per_sec': total_updates / elapsed,
+            'transitions_per_sec': (self.transitions - start_transitions) / elapsed,
+        }
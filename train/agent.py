@@ -2,12 +2,14 @@ import numpy as np
 import random
 import torch
 from torch import optim
-from collections import deque
 from qnetwork import QNetwork
+from replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+from profiler import Profiler
 import datetime
 
 class Agent:
-    def __init__(self, env, state_size, action_size, atom_size=51, gamma=0.99, lr=0.9):
+    def __init__(self, env, state_size, action_size, atom_size=51, gamma=0.99, lr=0.9, memory_size=2000, memory=None,
+                 profiler=None):
         self.env = env
         self.state_size = state_size
         self.action_size = action_size
@@ -34,9 +36,19 @@ class Agent:
         self.epsilon_decay = 0.995
 
         # Initialize experience replay memory
-        self.memory = deque(maxlen=2000)
+        # memoryにIndexedReplayBuffer(capacity, env.features)や
+        # PrioritizedReplayBuffer(capacity, state_size)を渡すと保存・サンプリング方式を切り替えられる
+        self.memory = memory if memory is not None else ReplayBuffer(memory_size, state_size)
+        self.prioritized = isinstance(self.memory, PrioritizedReplayBuffer)
         self.batch_size = 64
 
+        # フェーズごとの計測。envにも同じprofilerを設定して、1つのレポートにまとめる
+        self.profiler = profiler if profiler is not None else Profiler()
+        if profiler is not None and hasattr(env, 'profiler'):
+            env.profiler = profiler
+        if self.device.type == "cuda" and self.profiler.sync is None:
+            self.profiler.sync = torch.cuda.synchronize
+
     # 確率的に行動を選択するε-グリーディー法と、ネットワークによるQ値予測を用いた行動選択を行う
     def get_action(self, state, episode):
         # Decrease epsilon over time
@@ -52,27 +64,45 @@ class Agent:
         action = np.argmax(act_values.cpu().data.numpy())
         return action
 
-    def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+    # VecTradingEnvMatsui用: 複数環境の状態をまとめて1回の順伝播で行動を選択する
+    def get_actions(self, states, episode):
+        epsilon = max(self.epsilon_min, self.epsilon_max - self.epsilon_decay * episode)
+
+        states = torch.from_numpy(states).float().to(self.device)
+        with torch.no_grad():
+            act_values = (self.q_network(states) * self.support).sum(dim=2)
+        actions = act_values.argmax(dim=1).cpu().numpy()
+
+        explore = np.random.rand(len(actions)) <= epsilon
+        actions[explore] = np.random.randint(self.action_size, size=explore.sum())
+        return actions
+
+    def remember(self, state, action, reward, next_state, done, step=None):
+        self.memory.add(state, action, reward, next_state, done, step)
 
     def replay(self):
+        profiler = self.profiler
         # Sample a minibatch from memory
-        minibatch = random.sample(self.memory, self.batch_size)
-        states, actions, rewards, next_states, dones = zip(*minibatch)
-        states = torch.from_numpy(np.array(states)).float().to(self.device)
-        actions = torch.tensor(actions).long().unsqueeze(1).to(self.device)
-        rewards = torch.tensor(rewards).float().unsqueeze(1).to(self.device)
-        next_states = torch.from_numpy(np.array(next_states)).float().to(self.device)
-        dones = torch.tensor(dones).float().unsqueeze(1).to(self.device)
-
-        # Compute Q(s_t, a)
-        q_dist = self.q_network(states)
-        q_dist = q_dist.gather(2, actions.unsqueeze(2).expand(-1, -1, self.atom_size))
+        with profiler.section('sample'):
+            if self.prioritized:
+                states, actions, rewards, next_states, dones, indices, weights = self.memory.sample(self.batch_size)
+            else:
+                states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
+            states = torch.from_numpy(states).to(self.device)
+            actions = torch.from_numpy(actions).unsqueeze(1).to(self.device)
+            rewards = torch.from_numpy(rewards).unsqueeze(1).to(self.device)
+            next_states = torch.from_numpy(next_states).to(self.device)
+            dones = torch.from_numpy(dones).unsqueeze(1).to(self.device)
+
+        # Compute the return distribution p(s_t, a)
+        with profiler.section('forward'):
+            q_dist = self.q_network.dist(states)
+            q_dist = q_dist.gather(1, actions.unsqueeze(2).expand(-1, -1, self.atom_size)).squeeze(1)
 
         # Compute distributional Bellman update
-        with torch.no_grad():
+        with profiler.section('projection'), torch.no_grad():
             next_action = (self.q_network(next_states) * self.support).sum(2).max(1)[1]
-            next_dist = self.target_network(next_states)[torch.arange(self.batch_size), next_action]
+            next_dist = self.target_network.dist(next_states)[torch.arange(self.batch_size), next_action]
             t_z = rewards + (1 - dones) * self.gamma * self.support.unsqueeze(0)
             t_z = t_z.clamp(min=self.v_min, max=self.v_max)
             b = (t_z - self.v_min) / self.delta_z
@@ -80,19 +110,32 @@ class Agent:
             u = b.ceil().long()
             d_m_l = (u.float() + (l == u).float() - b) * next_dist
             d_m_u = (b - l.float()) * next_dist
-        m = states.new_zeros(self.batch_size, self.atom_size)
-        m.scatter_add_(1, l, d_m_l)
-        m.scatter_add_(1, u, d_m_u)
+            m = states.new_zeros(self.batch_size, self.atom_size)
+            m.scatter_add_(1, l, d_m_l)
+            m.scatter_add_(1, u, d_m_u)
 
         # Update Q_Network
-        self.q_network.train()
-        self.optimizer.zero_grad()
-        loss = -(m * q_dist.log()).sum(1).mean()
-        loss.backward()
-        self.optimizer.step()
+        with profiler.section('backward'):
+            self.q_network.train()
+            self.optimizer.zero_grad()
+            # Per-sample cross-entropy between the projected target and the predicted distribution
+            sample_loss = -(m * q_dist.clamp(min=1e-8).log()).sum(1)
+            if self.prioritized:
+                loss = (sample_loss * torch.from_numpy(weights).to(self.device)).mean()
+            else:
+                loss = sample_loss.mean()
+            loss.backward()
+        with profiler.section('optimizer'):
+            self.optimizer.step()
+
+        if self.prioritized:
+            with profiler.section('priority_update'):
+                self.memory.update_priorities(indices, sample_loss.detach().cpu().numpy())
 
         # Update target network
-        self.update_target_network()
+        with profiler.section('target_update'):
+            self.update_target_network()
+        profiler.count('update')
 
     def update_target_network(self, tau=0.05):
         for target_param, param in zip(self.target_network.parameters(), self.q_network.parameters()):
@@ -101,11 +144,16 @@ class Agent:
     def learn(self, current_episode, total_episodes):
         state = self.env.reset()
         state = np.reshape(state, [1, self.state_size])
+        profiler = self.profiler
         for time in range(total_episodes):
-            action = self.get_action(state, current_episode)
-            next_state, reward, done, _ = self.env.step(action)
+            with profiler.section('action'):
+                action = self.get_action(state, current_episode)
+            step = self.env.current_step
+            with profiler.section('env_step'):
+                next_state, reward, done, _ = self.env.step(action)
             next_state = np.reshape(next_state, [1, self.state_size])
-            self.remember(state, action, reward, next_state, done)
+            with profiler.section('remember'):
+                self.remember(state, action, reward, next_state, done, step)
             state = next_state
             if done:
                 # print("Episode: {}/{}, Score: {}" 
@@ -113,7 +161,8 @@ class Agent:
                 break
             if len(self.memory) > self.batch_size:
                 self.replay()
-            
+
+        profiler.report(episode=current_episode, episode_reward=self.env.episode_reward)
         return self.env.episode_reward
     
     def save_model(self):
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import numpy as np
+import pandas as pd
+import torch
+from feature_engineer import FeatureEngineer
+from trading_env_matsui import TradingEnvMatsui
+from agent import Agent
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# train/ の学習スタックのスループットを計測するベンチマーク
+# 合成した1分足OHLCVに対して、特徴量生成・環境のステップ・Agent.replay・Agent.perform_actionを
+# 固定シードで実行し、結果をJSONに保存する。--compareで基準のJSONと比べて性能の劣化を検出する
+#
+# usage:
+#   python benchmark.py --rows 100000 --output baseline.json
+#   python benchmark.py --rows 100000 --compare baseline.json --tolerance 0.1
+
+def synthetic_ohlcv(rows, seed=0, start_price=30000.0, volatility=0.0008):
+    # 対数収益率が正規分布に従う1分足。high/lowはopen/closeを必ず含む
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, volatility, rows)))
+    open = np.concatenate([[start_price], close[:-1]])
+    wick = np.abs(rng.normal(0, volatility, (2, rows))) * close
+    high = np.maximum(open, close) + wick[0]
+    low = np.minimum(open, close) - wick[1]
+    volume = rng.gamma(2.0, 5.0, rows)
+    index = pd.date_range('2021-08-01', periods=rows, freq='1min')
+    return pd.DataFrame({'open': open, 'high': high, 'low': low, 'close': close, 'volume': volume}, index=index)
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+def best_of(repeat, func):
+    # Report the fastest run: slower runs only measure interference from the rest of the machine
+    return min(func() for _ in range(repeat))
+
+def bench_feature_engineering(raw, repeat):
+    def run():
+        df = raw.copy()
+        start = time.perf_counter()
+        FeatureEngineer(df).feature_engineering(df)
+        return time.perf_counter() - start
+    seconds = best_of(repeat, run)
+    return {'seconds': seconds, 'rows_per_sec': len(raw) / seconds}
+
+def bench_env_step(df, steps, seed, repeat):
+    env = TradingEnvMatsui(df)
+    steps = min(steps, len(df) - 1)
+    actions = np.random.default_rng(seed).integers(0, 3, size=steps).tolist()
+    def run():
+        env.reset()
+        start = time.perf_counter()
+        for action in actions:
+            env.step(action)
+        return time.perf_counter() - start
+    seconds = best_of(repeat, run)
+    return {'seconds': seconds, 'steps_per_sec': steps / seconds}
+
+def make_agent(df, seed, memory_size):
+    seed_everything(seed)
+    env = TradingEnvMatsui(df)
+    agent = Agent(env, env.n_features + 4, env.action_space.n, lr=1e-3, memory_size=memory_size)
+    # Fill the replay memory with real transitions from a random policy
+    rng = np.random.default_rng(seed)
+    state = env.reset()
+    for _ in range(min(memory_size, len(df) - 1)):
+        step = env.current_step
+        action = int(rng.integers(3))
+        next_state, reward, done, _ = env.step(action)
+        agent.remember(state, action, reward, next_state, done, step)
+        state = env.reset() if done else next_state
+    return agent
+
+def bench_replay(agent, updates, seed, repeat):
+    def run():
+        seed_everything(seed)
+        start = time.perf_counter()
+        for _ in range(updates):
+            agent.replay()
+        return time.perf_counter() - start
+    seconds = best_of(repeat, run)
+    return {'seconds': seconds, 'updates_per_sec': updates / seconds}
+
+def bench_perform_action(agent, calls, repeat):
+    states = agent.memory.states[:calls]
+    def run():
+        start = time.perf_counter()
+        for state in states:
+            agent.perform_action(state)
+        return time.perf_counter() - start
+    seconds = best_of(repeat, run)
+    return {'seconds': seconds, 'calls_per_sec': len(states) / seconds}
+
+def run_suite(args):
+    torch.set_num_threads(args.threads)
+    seed_everything(args.seed)
+    raw = synthetic_ohlcv(args.rows, args.seed)
+    results = {}
+
+    results['feature_engineering'] = bench_feature_engineering(raw, args.repeat)
+
+    df = FeatureEngineer(raw.copy()).feature_engineering(raw.copy()).reset_index(drop=True)
+    results['env_step'] = bench_env_step(df, args.env_steps, args.seed, args.repeat)
+
+    agent = make_agent(df, args.seed, args.memory_size)
+    results['replay'] = bench_replay(agent, args.updates, args.seed, args.repeat)
+
+    results['perform_action'] = bench_perform_action(agent, args.actions, args.repeat)
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'rows': args.rows,
+            'seed': args.seed,
+            'threads': args.threads,
+            'repeat': args.repeat,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'torch': torch.__version__,
+        },
+        'results': results,
+        # ru_maxrssはプロセス全体の最大値なので、ベンチマークごとではなく1つだけ記録する
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+# (benchmark, metric, higher_is_better)
+METRICS = [
+    ('feature_engineering', 'rows_per_sec', True),
+    ('env_step', 'steps_per_sec', True),
+    ('replay', 'updates_per_sec', True),
+    ('perform_action', 'calls_per_sec', True),
+]
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    print(f'{"metric":40}{"baseline":>14}{"current":>14}{"change":>10}')
+    rows = [(f'{name}.{metric}', baseline['results'][name][metric], report['results'][name][metric], higher)
+            for name, metric, higher in METRICS if name in baseline['results']]
+    # 古い基準のJSONはベンチマークごとの値(実際はそれまでの最大値)なので比べない
+    base_rss, rss = baseline.get('peak_rss_mb'), report['peak_rss_mb']
+    if isinstance(base_rss, (int, float)) and rss is not None:
+        rows.append(('peak_rss_mb', base_rss, rss, False))
+    for label, base, current, higher in rows:
+        change = current / base - 1
+        regressed = change < -tolerance if higher else change > tolerance
+        flag = '  REGRESSION' if regressed else ''
+        print(f'{label:40}{base:14.1f}{current:14.1f}{change:+9.1%}{flag}')
+        if regressed:
+            regressions.append(label)
+    if baseline['meta'].get('rows') != report['meta']['rows']:
+        print(f"warning: baseline used {baseline['meta'].get('rows')} rows, this run {report['meta']['rows']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000, help='length of the synthetic 1m OHLCV series')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark; the fastest is reported')
+    parser.add_argument('--env-steps', type=int, default=20000)
+    parser.add_argument('--memory-size', type=int, default=10000)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--actions', type=int, default=2000)
+    parser.add_argument('--output', help='write the report to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative slowdown before flagging')
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regression(s): ' + ', '.join(regressions))
+            sys.exit(1)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
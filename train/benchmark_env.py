@@ -0,0 +1,65 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from trading_env_matsui import TradingEnvMatsui
+
+# 観測生成の1ステップあたりのコストを、旧実装(iloc + np.append)と比較するベンチマーク
+# usage: python benchmark_env.py --rows 100000 --features 30 --steps 20000
+
+def make_frame(rows, n_features, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.standard_normal((rows, n_features)), columns=[f'f{i}' for i in range(n_features)])
+    df['close'] = 30000 + rng.standard_normal(rows).cumsum()
+    return df
+
+def legacy_observation(env):
+    total_asset = env.cash + env.holdings * env.purchase_price
+    cash_ratio = env.cash / total_asset
+    holdings_ratio = env.holdings * env.purchase_price / total_asset
+    return np.append(env.df.iloc[env.current_step], [env.holdings, env.cash, cash_ratio, holdings_ratio])
+
+def legacy_price(env):
+    return env.df.iloc[env.current_step]['close']
+
+def time_per_call(func, steps, env):
+    env.reset()
+    start = time.perf_counter()
+    for i in range(steps):
+        env.current_step = i
+        func(env)
+    return (time.perf_counter() - start) / steps * 1e6
+
+def time_env_step(env, steps, seed=0):
+    actions = np.random.default_rng(seed).integers(0, 3, size=steps).tolist()
+    env.reset()
+    start = time.perf_counter()
+    for action in actions:
+        env.step(action)
+    return (time.perf_counter() - start) / steps * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--features', type=int, default=30)
+    parser.add_argument('--steps', type=int, default=20000)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.features)
+    env = TradingEnvMatsui(df)
+    steps = min(args.steps, args.rows - 1)
+
+    legacy_obs = time_per_call(legacy_observation, steps, env)
+    legacy_px = time_per_call(legacy_price, steps, env)
+    new_obs = time_per_call(TradingEnvMatsui._get_observation, steps, env)
+    new_px = time_per_call(lambda e: e.close[e.current_step], steps, env)
+    step = time_env_step(env, steps)
+
+    print(f'rows={args.rows} features={args.features} steps={steps}')
+    print(f'{"":24}{"before [us]":>14}{"after [us]":>14}{"speedup":>10}')
+    print(f'{"observation":24}{legacy_obs:14.2f}{new_obs:14.2f}{legacy_obs / new_obs:9.1f}x')
+    print(f'{"price lookup":24}{legacy_px:14.2f}{new_px:14.2f}{legacy_px / new_px:9.1f}x')
+    print(f'{"env.step (after)":24}{"":14}{step:14.2f}')
+
+if __name__ == '__main__':
+    main()
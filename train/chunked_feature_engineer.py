@@ -0,0 +1,135 @@
+import os
+import numpy as np
+import talib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from feature_pipeline import FeaturePipeline, train_spec
+
+# 長期間の1分足の特徴量を、ウォームアップ付きの塊に分けてプロセスプールで計算する
+# 出力はFeatureEngineer.feature_engineeringと完全に同じ(ビット単位で一致)になるようにしている
+#  - RSI, MACD, ATR, ADXなどの再帰的な指標は、十分なウォームアップがあれば系列の先頭から計算した値と一致する
+#  - SMA, BBANDS, STOCHはtalibが足し引きで移動合計を更新するので、計算の開始位置で丸め誤差が変わる
+#    OBVは先頭からの累積値。これらはO(n)で軽いので、分割せずに全期間で1回だけ計算する
+# 塊の境目では、前の塊と重なる区間の値が一致することを確認し、一致しなければ例外を出す
+#
+# usage:
+#   with ChunkedFeatureEngineer(chunk_size=200000, n_jobs=4) as fe:
+#       for path in csv_paths:                      # 複数銘柄でプールを使い回す
+#           df = fe.feature_engineering(pd.read_csv(path))
+
+# 計算の開始位置に依存するtalibの関数。これらに依存する列は分割しない
+SEQUENTIAL_FUNCS = {talib.SMA, talib.BBANDS, talib.STOCH, talib.OBV}
+
+RAW_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+def depends_on(node, funcs):
+    if isinstance(node, str):
+        return False
+    return node.func in funcs or any(depends_on(i, funcs) for i in node.inputs)
+
+def lookback(node):
+    # ノードとその入力の最大の期間(timeperiod, slowperiod, windowなど整数の引数の最大値)
+    if isinstance(node, str):
+        return 0
+    periods = [v for v in node.params.values() if isinstance(v, int) and not isinstance(v, bool)]
+    return max(periods + [lookback(i) for i in node.inputs])
+
+_worker_pipeline = None
+
+def _init_worker(spec_args, columns):
+    global _worker_pipeline
+    _worker_pipeline = FeaturePipeline(train_spec(*spec_args), columns)
+
+def _compute_chunk(raw, skip):
+    # rawはウォームアップを含む塊。先頭のskip行はウォームアップなので捨てる
+    return {name: values[skip:] for name, values in _worker_pipeline.compute(raw).items()}
+
+class ChunkedFeatureEngineer:
+    def __init__(self, rci_windows=(9,), columns=None, chunk_size=200000, warmup=None, check=64, n_jobs=None):
+        self.spec_args = (rci_windows,)
+        pipeline = FeaturePipeline(train_spec(rci_windows), columns)
+        self.columns = pipeline.columns
+        self.sequential_columns = [c for c, node in pipeline.spec.items() if depends_on(node, SEQUENTIAL_FUNCS)]
+        self.chunked_columns = [c for c in self.columns if c not in self.sequential_columns]
+        self.sequential = FeaturePipeline(pipeline.spec, self.sequential_columns)
+
+        # 再帰的な指標の初期値の影響が丸め誤差より小さくなるまで。Wilderの平滑化で期間の約40倍、ADXは2段なので余裕を持たせる
+        longest = max([lookback(pipeline.spec[c]) for c in self.chunked_columns] + [1])
+        self.warmup = 100 * longest if warmup is None else warmup
+        self.check = check
+        self.chunk_size = chunk_size
+        self.n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _tasks(self, raw, n_rows):
+        # (塊の開始, 終了, 返す値の開始, ウォームアップを含む入力, 捨てる行数)
+        # 返す値は前の塊と重なるcheck行を含む
+        for start in range(0, n_rows, self.chunk_size):
+            end = min(start + self.chunk_size, n_rows)
+            first = max(0, start - self.check)
+            begin = max(0, first - self.warmup)
+            yield start, end, first, {c: v[begin:end] for c, v in raw.items()}, first - begin
+
+    def _run(self, raw, n_rows):
+        # 完了した塊を順不同で返す。投入中の塊の数を抑えて、メモリを塊の数に比例させない
+        tasks = self._tasks(raw, n_rows)
+        if self.n_jobs == 1:
+            _init_worker(self.spec_args, self.chunked_columns)
+            for start, end, first, chunk, skip in tasks:
+                yield start, end, first, _compute_chunk(chunk, skip)
+            return
+
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.n_jobs, initializer=_init_worker,
+                                            initargs=(self.spec_args, self.chunked_columns))
+        pending = {}
+        while True:
+            for start, end, first, chunk, skip in tasks:
+                pending[self.pool.submit(_compute_chunk, chunk, skip)] = (start, end, first)
+                if len(pending) >= 2 * self.n_jobs:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future) + (future.result(),)
+
+    def feature_engineering(self, df):
+        n_rows = len(df)
+        raw = {c: df[c].values for c in RAW_COLUMNS if c in df.columns}
+        out = self.sequential.compute(df)
+
+        overlaps = []
+        for start, end, first, values in self._run(raw, n_rows):
+            overlap = start - first
+            for name, chunk in values.items():
+                if name not in out:
+                    out[name] = np.empty(n_rows, dtype=chunk.dtype)
+                out[name][start:end] = chunk[overlap:]
+            if overlap:
+                overlaps.append((first, start, {name: chunk[:overlap].copy() for name, chunk in values.items()}))
+        # 塊の境目で、前の塊と重なる区間の値が一致することを確かめる
+        for first, start, values in overlaps:
+            for name, chunk in values.items():
+                if not np.array_equal(chunk, out[name][first:start], equal_nan=True):
+                    raise RuntimeError(f"{name}: chunk at row {start} does not match the previous chunk; "
+                                       f"increase warmup (currently {self.warmup})")
+
+        for name in self.columns:
+            df[name] = out[name]
+
+        df = df.fillna(method='ffill')
+        df = df.fillna(method='bfill')
+
+        return df
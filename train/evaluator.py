@@ -0,0 +1,112 @@
+import numpy as np
+import torch
+
+# 学習済みQNetworkの貪欲方策をテスト期間で評価する
+# 観測のうち市場特徴量は行動に依存せず、ポートフォリオの4変数は売買が成立したときしか変わらない。
+# そこで現在のポートフォリオのまま期間の塊をまとめて順伝播し、最初に売買が成立するステップまでを採用して
+# そこから次の塊を評価する。報酬とfの漸化式は採用したステップについて順に解く
+#
+# usage:
+#   agent.load_model(model_path)
+#   result = Evaluator(agent, TradingEnvMatsui(df_test)).run_batched()
+
+class Evaluator:
+    def __init__(self, agent, env, chunk_size=4096, min_chunk_size=16):
+        self.agent = agent
+        self.env = env
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+
+    def run_stepwise(self):
+        # 1行ずつ環境を進める従来の評価方法(比較用)
+        env = self.env
+        state = env.reset()
+        actions, rewards, total_assets, holdings = [], [], [], []
+        done = False
+        while True:
+            action = self.agent.perform_action(state)
+            state, reward, done, _ = env.step(action)
+            if done:
+                break
+            actions.append(action)
+            rewards.append(reward)
+            total_assets.append(env.cash + env.holdings * env.close[env.current_step - 1])
+            holdings.append(env.holdings)
+        return self._result(actions, rewards, total_assets, holdings, env.cash, env.f, env.episode_reward)
+
+    def _greedy_actions(self, start, end, portfolio):
+        env = self.env
+        obs = np.empty((end - start, env.n_features + 4), dtype=np.float32)
+        obs[:, :env.n_features] = env.features[start:end]
+        obs[:, env.n_features:] = portfolio
+        with torch.no_grad():
+            states = torch.from_numpy(obs).to(self.agent.device)
+            act_values = (self.agent.q_network(states) * self.agent.support).sum(dim=2)
+        return np.argmax(act_values.cpu().numpy(), axis=1)
+
+    def run_batched(self):
+        env = self.env
+        close = np.asarray(env.close, dtype=np.float64)
+        last_step = len(close) - 1
+        cash = float(env.cash_initial)
+        holding = 0
+        purchase_price = 0.0
+        f = 0.5
+        episode_reward = 0.0
+        actions, rewards, total_assets, holdings = [], [], [], []
+
+        t = 0
+        chunk_size = self.chunk_size
+        while t < last_step:
+            total_asset = cash + holding * purchase_price
+            portfolio = (holding, cash, cash / total_asset, holding * purchase_price / total_asset)
+            end = min(t + chunk_size, last_step)
+            chunk_actions = self._greedy_actions(t, end, portfolio)
+
+            # The first trade that fills changes the portfolio, so the chunk is only valid up to it
+            fills = ((chunk_actions == 1) & (cash >= close[t:end]) & (holding < env.max_holdings)) | \
+                    ((chunk_actions == 2) & (holding > 0))
+            n_valid = int(np.argmax(fills)) + 1 if fills.any() else end - t
+            # Size the next chunk from how long the portfolio stayed unchanged this time
+            chunk_size = min(self.chunk_size, max(self.min_chunk_size, 2 * n_valid))
+
+            for action, price in zip(chunk_actions[:n_valid].tolist(), close[t:t + n_valid].tolist()):
+                old_total_asset = cash + holding * purchase_price
+                if action == 1 and cash >= price and holding < env.max_holdings:
+                    holding += 1
+                    cash -= price * (1 + env.transaction_cost)
+                    purchase_price = price
+                elif action == 2 and holding > 0:
+                    holding -= 1
+                    cash += price * (1 - env.transaction_cost)
+
+                new_total_asset = cash + holding * price
+                if old_total_asset > 0:
+                    reward = (new_total_asset - old_total_asset) / old_total_asset
+                    reward = (1 + reward * f) ** env.gamma
+                else:
+                    reward = 0
+                if holding == 0 and action == 0:
+                    reward = -0.5
+                f += env.eta * reward / (1 + reward * f)
+                f = max(0, min(f, 0.99))
+                episode_reward += reward
+
+                actions.append(action)
+                rewards.append(reward)
+                total_assets.append(new_total_asset)
+                holdings.append(holding)
+            t += n_valid
+
+        return self._result(actions, rewards, total_assets, holdings, cash, f, episode_reward)
+
+    def _result(self, actions, rewards, total_assets, holdings, cash, f, episode_reward):
+        return {
+            'actions': np.array(actions, dtype=np.int64),
+            'rewards': np.array(rewards, dtype=np.float64),
+            'total_asset': np.array(total_assets, dtype=np.float64),
+            'holdings': np.array(holdings, dtype=np.int64),
+            'cash': cash,
+            'f': f,
+            'episode_reward': episode_reward,
+        }
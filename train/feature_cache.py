@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import talib
+from numpy.lib.format import open_memmap
+from feature_engineer import FeatureEngineer
+
+# CSVの読み込みと特徴量生成の結果をディスクにキャッシュし、2回目以降はメモリマップで読み込む
+# キーは「CSVの中身」「特徴量の定義(spec)」「特徴量計算のソースコード」「talib/numpy/pandasのバージョン」のハッシュ
+# どれかが変われば別のキーになり、再計算される
+#
+# usage:
+#   cache = FeatureCache('../cache/features')
+#   df = cache.load('../csv/BTCUSDT_1m_20210801_20221231.csv')   # 初回は計算して保存、以降は数秒で読み込み
+#   df = cache.load(csv_path, rci_windows=(9, 26, 52))             # 特徴量の設定ごとに別のキャッシュ
+
+CACHE_VERSION = 1
+_SOURCES = ['feature_pipeline.py', 'feature_engineer.py']
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _describe(key):
+    # Node.keyをJSONにできる形にする(関数はモジュール名と名前で表す)
+    if isinstance(key, str):
+        return key
+    func, inputs, params = key
+    name = getattr(func, '__qualname__', None) or func.__name__
+    module = getattr(func, '__module__', None) or type(func).__module__
+    return [f'{module}.{name}', [_describe(i) for i in inputs], [[k, repr(v)] for k, v in params]]
+
+class FeatureCache:
+    def __init__(self, cache_dir='../cache/features'):
+        self.cache_dir = cache_dir
+
+    def fingerprint(self, csv_path, pipeline):
+        here = os.path.dirname(os.path.abspath(__file__))
+        config = {
+            'version': CACHE_VERSION,
+            'data': file_digest(csv_path),
+            'features': [[name, _describe(node.key)] for name, node in pipeline.spec.items()],
+            'code': [file_digest(os.path.join(here, source)) for source in _SOURCES],
+            'libraries': [talib.__version__, np.__version__, pd.__version__],
+        }
+        return hashlib.blake2b(json.dumps(config).encode(), digest_size=16).hexdigest()
+
+    def load(self, csv_path, rci_windows=(9,), columns=None, mmap_mode='c'):
+        # mmap_mode='c'はコピーオンライト。DataFrameを書き換えてもキャッシュのファイルは変わらない
+        fe = FeatureEngineer(None, rci_windows, columns)
+        path = os.path.join(self.cache_dir, self.fingerprint(csv_path, fe.pipeline))
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            return self.read(path, mmap_mode)
+
+        df = pd.read_csv(csv_path)
+        df = fe.feature_engineering(df)
+        self.write(path, df, source=csv_path)
+        return df
+
+    def write(self, path, df, source=None):
+        # float64の列は1つのFortran順の.npyにまとめる。列ごとに連続なので、そのままDataFrameの1ブロックになる
+        float_columns = [c for c in df.columns if df[c].dtype == np.float64]
+        other_columns = [c for c in df.columns if df[c].dtype != np.float64]
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        block = open_memmap(os.path.join(tmp, 'float64.npy'), mode='w+', dtype=np.float64,
+                            shape=(len(df), len(float_columns)), fortran_order=True)
+        for j, column in enumerate(float_columns):
+            block[:, j] = df[column].values
+        block.flush()
+        del block
+        if other_columns:
+            df[other_columns].to_pickle(os.path.join(tmp, 'other.pkl'))
+        meta = {
+            'columns': [str(c) for c in df.columns],
+            'float_columns': [str(c) for c in float_columns],
+            'n_rows': len(df),
+            'source': source,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        # Publish the whole directory at once so readers never see a partial entry
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def read(self, path, mmap_mode='c'):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        block = np.load(os.path.join(path, 'float64.npy'), mmap_mode=mmap_mode)
+        df = pd.DataFrame(block, columns=meta['float_columns'], copy=False)
+        other_path = os.path.join(path, 'other.pkl')
+        if os.path.exists(other_path):
+            other = pd.read_pickle(other_path)
+            for column in other.columns:
+                df.insert(meta['columns'].index(column), column, other[column].values)
+        return df
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
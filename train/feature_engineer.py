@@ -1,54 +1,31 @@
 import numpy as np
-import talib
+from feature_pipeline import FeaturePipeline, train_spec, rolling_rci, pinbar_signal
 
 class FeatureEngineer:
-    def __init__(self, df):
+    def __init__(self, df, rci_windows=(9,), columns=None):
         self.df = df
+        # RCIの期間。9は従来どおり'RCI'列、それ以外は'RCI26'のように期間付きの列名になる
+        self.rci_windows = rci_windows
+        # columnsを指定すると、その特徴量と計算に必要な中間結果だけを計算する
+        self.pipeline = FeaturePipeline(train_spec(rci_windows), columns)
 
     def log_transform_feature(self, X):
         X[X <= 0] = np.finfo(float).eps
         return np.log(X)
-    
+
     def calc_rank_correlation(self, series):
         n = len(series)
         ranks = series.rank()
         sum_diffs_squared = sum((ranks - np.arange(n) - 1) ** 2)
         return 1 - 6 * sum_diffs_squared / (n * (n ** 2 - 1))
 
-    def feature_engineering(self, df):
-        open = df['open'].values
-        high = df['high'].values
-        low = df['low'].values
-        close = df['close'].values
-        # volume = df['volume'].values
-        hilo = (high + low) / 2
-
-        df['RSI8'] = talib.RSI(close, timeperiod=8) # default = 14
-        df['RSI14'] = talib.RSI(close, timeperiod=14)
-        df['RSI_ST'] = talib.RSI(close)/close
-        df['RSI_LOG'] = self.log_transform_feature(talib.RSI(close))
-        df['MACD'], _, _ = talib.MACD(close)
-        df['MACD_ST'], _, _ = talib.MACD(close)/close
-        df['ATR'] = talib.ATR(high, low, close)
-        
-        df['ADX'] = talib.ADX(high, low, close, timeperiod=14)
-        df['ADXR'] = talib.ADXR(high, low, close, timeperiod=14)
-        df['+DI'] = talib.PLUS_DI(high, low, close, timeperiod=14)
-        df['-DI'] = talib.MINUS_DI(high, low, close, timeperiod=14)
-        
-        df['SMA15'] = talib.SMA(close, timeperiod=15) # 15分足
-        df['SMA300'] = talib.SMA(close, timeperiod=300) # 15分足20MA
-        
-        df['BB_UPPER'], df['BB_MIDDLE'], df['BB_LOWER'] = talib.BBANDS(close, timeperiod=20, nbdevup=2, nbdevdn=2, matype=0)
-        df['BBANDS_upperband'] = (df['BB_UPPER'] - hilo) / close
-        df['BBANDS_middleband'] = (df['BB_MIDDLE'] - hilo) / close
-        df['BBANDS_lowerband'] = (df['BB_LOWER'] - hilo) / close
-
-        df['STOCH_K'], df['STOCH_D'] = talib.STOCH(high, low, close)/close
-        df['MON'] = talib.MOM(close, timeperiod=5)
+    def rci(self, close, window=9, max_chunk_elements=2 ** 22):
+        # calc_rank_correlationを全ウィンドウに対して一括で計算する(rolling().applyと同じ値)
+        return rolling_rci(close, window, max_chunk_elements)
 
-        df['pinbar'] = self.pinbar(df)
-        df['RCI'] = df['close'].rolling(9).apply(self.calc_rank_correlation)
+    def feature_engineering(self, df):
+        # 特徴量の定義はfeature_pipeline.train_spec
+        df = self.pipeline.transform(df)
 
         df = df.fillna(method='ffill')
         df = df.fillna(method='bfill')
@@ -56,18 +33,4 @@ class FeatureEngineer:
         return df
 
     def pinbar(self, df):
-        body = np.abs(df['close'] - df['open'])
-        upper_wick = df['high'] - np.max(df[['open', 'close']], axis=1)
-        lower_wick = np.min(df[['open', 'close']], axis=1) - df['low']
-        total_length = df['high'] - df['low']
-        
-        # 上向きのピンバー（ロングサイン）:下ワックが本体の3倍以上、上ワックが全体の長さの20~30%以内
-        is_bullish_pinbar = (lower_wick >= 3 * body) & (upper_wick <= total_length * 0.3)
-        
-        # 下向きのピンバー（ショートサイン）:上ワックが本体の3倍以上、下ワックが全体の長さの20~30%以内
-        is_bearish_pinbar = (upper_wick >= 3 * body) & (lower_wick <= total_length * 0.3)
-        
-        # 上向きピンバー = 1、下向きピンバー = 2、ピンバーでない = 0
-        return np.where(is_bullish_pinbar, 1, np.where(is_bearish_pinbar, 2, 0))
-
-
+        return pinbar_signal(df['open'].values, df['high'].values, df['low'].values, df['close'].values)
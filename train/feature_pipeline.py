@@ -0,0 +1,243 @@
+import numpy as np
+import talib
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 特徴量を「関数・入力・引数」を持つノードの辞書として宣言し、必要な列だけを計算するパイプライン
+# 関数・入力・引数が同じノードは1回の実行で1度だけ計算して使い回す
+# (RSI14はRSI14/RSI_ST/RSI_LOGで、MACDはMACD/MACD_STで共有される)
+# 学習(FeatureEngineer)もbot(predict.py)も、ここのノード定義とspecを使う
+#
+# usage:
+#   pipeline = FeaturePipeline(train_spec())
+#   df = pipeline.transform(df)                              # df['RSI14']などを追加する
+#   pipeline = FeaturePipeline(live_spec(), columns=['RSI_ST', 'MACD_ST'])   # 使う列とその依存だけ計算
+#   df = pipeline.transform(df, prefix='5m_')                # 5m_closeなどを読み、5m_RSI_STなどを書く
+
+OPEN, HIGH, LOW, CLOSE, VOLUME = 'open', 'high', 'low', 'close', 'volume'
+
+class Node:
+    # inputsは生の列名(OPEN, CLOSEなど)か他のNode
+    def __init__(self, func, inputs, **params):
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = params
+        self.key = (func, tuple(i if isinstance(i, str) else i.key for i in self.inputs),
+                    tuple(sorted(params.items())))
+
+class FeaturePipeline:
+    def __init__(self, spec, columns=None):
+        if columns is not None:
+            missing = [name for name in columns if name not in spec]
+            if missing:
+                raise KeyError(f"unknown feature(s): {', '.join(missing)}")
+            spec = {name: node for name, node in spec.items() if name in columns}
+        self.spec = spec
+
+    @property
+    def columns(self):
+        return list(self.spec)
+
+    def compute(self, df, prefix=''):
+        # 1回の実行の中だけで中間結果をキャッシュする
+        cache = {}
+
+        def evaluate(node):
+            if isinstance(node, str):
+                if node not in cache:
+                    cache[node] = np.asarray(df[prefix + node])
+                return cache[node]
+            if node.key not in cache:
+                cache[node.key] = node.func(*[evaluate(i) for i in node.inputs], **node.params)
+            return cache[node.key]
+
+        return {name: evaluate(node) for name, node in self.spec.items()}
+
+    def transform(self, df, prefix=''):
+        for name, values in self.compute(df, prefix).items():
+            df[prefix + name] = values
+        return df
+
+# --- 計算本体 ---
+
+def log_transform(X):
+    # Nodes share their outputs, so never modify an input array in place
+    X = X.copy()
+    X[X <= 0] = np.finfo(float).eps
+    return np.log(X)
+
+def hilo(high, low):
+    return (high + low) / 2
+
+def pinbar_signal(open, high, low, close):
+    body = np.abs(close - open)
+    # fmax/fmin skip NaN like DataFrame.max/min(axis=1)
+    upper_wick = high - np.fmax(open, close)
+    lower_wick = np.fmin(open, close) - low
+    total_length = high - low
+
+    # 上向きのピンバー（ロングサイン）:下ワックが本体の3倍以上、上ワックが全体の長さの20~30%以内
+    is_bullish_pinbar = (lower_wick >= 3 * body) & (upper_wick <= total_length * 0.3)
+
+    # 下向きのピンバー（ショートサイン）:上ワックが本体の3倍以上、下ワックが全体の長さの20~30%以内
+    is_bearish_pinbar = (upper_wick >= 3 * body) & (lower_wick <= total_length * 0.3)
+
+    # 上向きピンバー = 1、下向きピンバー = 2、ピンバーでない = 0
+    return np.where(is_bullish_pinbar, 1, np.where(is_bearish_pinbar, 2, 0))
+
+def rolling_rci(close, window=9, max_chunk_elements=2 ** 22):
+    # 全ウィンドウのRCIを一括で計算する(close.rolling(window).apply(calc_rank_correlation)と同じ値)
+    # 各ウィンドウをソートし、同値はpandasのrank()と同じく平均順位にする
+    close = np.asarray(close, dtype=np.float64)
+    result = np.full(len(close), np.nan)
+    if len(close) < window:
+        return result
+    windows = sliding_window_view(close, window)
+    positions = np.arange(window)
+    time_ranks = positions + 1
+    denominator = window * (window ** 2 - 1)
+    chunk_rows = max(1, max_chunk_elements // window)
+    for start in range(0, len(windows), chunk_rows):
+        chunk = windows[start:start + chunk_rows]
+        order = np.argsort(chunk, axis=1, kind='stable')
+        ordered = np.take_along_axis(chunk, order, axis=1)
+        # A run of equal values shares the mean of its first and last sorted position
+        run_start = np.ones(ordered.shape, dtype=bool)
+        run_start[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+        run_end = np.ones(ordered.shape, dtype=bool)
+        run_end[:, :-1] = run_start[:, 1:]
+        first = np.maximum.accumulate(np.where(run_start, positions, 0), axis=1)
+        last = np.minimum.accumulate(np.where(run_end, positions, window - 1)[:, ::-1], axis=1)[:, ::-1]
+        price_ranks = (first + last) / 2 + 1
+        sum_diffs_squared = ((price_ranks - time_ranks[order]) ** 2).sum(axis=1)
+        rci = 1 - 6 * sum_diffs_squared / denominator
+        # rolling() yields NaN for any window that contains NaN
+        rci[np.isnan(chunk).any(axis=1)] = np.nan
+        result[window - 1 + start:window - 1 + start + len(chunk)] = rci
+    return result
+
+def _output(values, index):
+    return values[index]
+
+# --- ノード ---
+# 引数はtalibの既定値も明示する。rsi()とrsi(14)が同じキーになり共有される
+
+def output(node, index):
+    # MACD, BBANDS, STOCHのように複数の配列を返すノードから1つを取り出す
+    return Node(_output, [node], index=index)
+
+def ratio(numerator, denominator):
+    return Node(np.divide, [numerator, denominator])
+
+def difference(a, b):
+    return Node(np.subtract, [a, b])
+
+def log_feature(node):
+    return Node(log_transform, [node])
+
+def hl2():
+    return Node(hilo, [HIGH, LOW])
+
+def rsi(timeperiod=14):
+    return Node(talib.RSI, [CLOSE], timeperiod=timeperiod)
+
+def macd(fastperiod=12, slowperiod=26, signalperiod=9):
+    return Node(talib.MACD, [CLOSE], fastperiod=fastperiod, slowperiod=slowperiod, signalperiod=signalperiod)
+
+def atr(timeperiod=14):
+    return Node(talib.ATR, [HIGH, LOW, CLOSE], timeperiod=timeperiod)
+
+def adx(timeperiod=14):
+    return Node(talib.ADX, [HIGH, LOW, CLOSE], timeperiod=timeperiod)
+
+def adxr(timeperiod=14):
+    return Node(talib.ADXR, [HIGH, LOW, CLOSE], timeperiod=timeperiod)
+
+def plus_di(timeperiod=14):
+    return Node(talib.PLUS_DI, [HIGH, LOW, CLOSE], timeperiod=timeperiod)
+
+def minus_di(timeperiod=14):
+    return Node(talib.MINUS_DI, [HIGH, LOW, CLOSE], timeperiod=timeperiod)
+
+def sma(timeperiod=30):
+    return Node(talib.SMA, [CLOSE], timeperiod=timeperiod)
+
+def bbands(timeperiod=20, nbdevup=2, nbdevdn=2, matype=0):
+    return Node(talib.BBANDS, [CLOSE], timeperiod=timeperiod, nbdevup=nbdevup, nbdevdn=nbdevdn, matype=matype)
+
+def stoch(fastk_period=5, slowk_period=3, slowk_matype=0, slowd_period=3, slowd_matype=0):
+    return Node(talib.STOCH, [HIGH, LOW, CLOSE], fastk_period=fastk_period, slowk_period=slowk_period,
+                slowk_matype=slowk_matype, slowd_period=slowd_period, slowd_matype=slowd_matype)
+
+def mom(timeperiod=10):
+    return Node(talib.MOM, [CLOSE], timeperiod=timeperiod)
+
+def obv():
+    return Node(talib.OBV, [CLOSE, VOLUME])
+
+def pinbar():
+    return Node(pinbar_signal, [OPEN, HIGH, LOW, CLOSE])
+
+def rci(window=9):
+    return Node(rolling_rci, [CLOSE], window=window)
+
+def _bollinger_features(bands):
+    # BB_UPPER/MIDDLE/LOWERと、そのhilo(高値と安値の中値)からの乖離をcloseで割った値
+    spec = {}
+    for index, band in enumerate(['UPPER', 'MIDDLE', 'LOWER']):
+        spec[f'BB_{band}'] = output(bands, index)
+    for index, band in enumerate(['upperband', 'middleband', 'lowerband']):
+        spec[f'BBANDS_{band}'] = ratio(difference(output(bands, index), hl2()), CLOSE)
+    return spec
+
+# --- spec(列名 -> ノード)。辞書の順番がそのまま列の順番になる ---
+
+def train_spec(rci_windows=(9,)):
+    spec = {
+        'RSI8': rsi(8),
+        'RSI14': rsi(14),
+        'RSI_ST': ratio(rsi(14), CLOSE),
+        'RSI_LOG': log_feature(rsi(14)),
+        'MACD': output(macd(), 0),
+        'MACD_ST': ratio(output(macd(), 0), CLOSE),
+        'ATR': atr(14),
+        'ADX': adx(14),
+        'ADXR': adxr(14),
+        '+DI': plus_di(14),
+        '-DI': minus_di(14),
+        'SMA15': sma(15),  # 15分足
+        'SMA300': sma(300),  # 15分足20MA
+    }
+    spec.update(_bollinger_features(bbands(20)))
+    spec.update({
+        'STOCH_K': ratio(output(stoch(), 0), CLOSE),
+        'STOCH_D': ratio(output(stoch(), 1), CLOSE),
+        'MON': mom(5),
+        'pinbar': pinbar(),
+    })
+    # RCIの期間。9は従来どおり'RCI'列、それ以外は'RCI26'のように期間付きの列名になる
+    for window in rci_windows:
+        spec['RCI' if window == 9 else f'RCI{window}'] = rci(window)
+    return spec
+
+def live_spec():
+    # bot/predict.pyが時間足ごとに計算する特徴量
+    spec = {
+        'RSI_ST': ratio(rsi(14), CLOSE),
+        'RSI_LOG': log_feature(rsi(14)),
+        'MACD': output(macd(), 0),
+        'MACD_ST': ratio(output(macd(), 0), CLOSE),
+        'ATR': atr(14),
+        'ADX': adx(14),
+        'ADXR': adxr(14),
+        'SMA20': sma(20),
+        'SMA50': sma(50),
+        'SMA200': sma(200),
+    }
+    spec.update(_bollinger_features(bbands()))
+    spec.update({
+        'STOCH_K': ratio(output(stoch(), 0), CLOSE),
+        'STOCH_D': ratio(output(stoch(), 1), CLOSE),
+        'MON': mom(5),
+        'OBV': obv(),
+    })
+    return spec
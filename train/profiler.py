@@ -0,0 +1,91 @@
+import json
+import time
+from collections import defaultdict
+
+# 学習ループのフェーズごとの所要時間と回数を計測する軽量プロファイラ
+# enabled=Falseのときsection()は何もしない共有オブジェクトを返すだけなので、計測を残したままでも負荷はほぼない
+#
+# usage:
+#   profiler = Profiler(enabled=True, log_path='../log/profile.jsonl')
+#   agent = Agent(env, state_size, action_size, profiler=profiler)   # envにも同じprofilerが設定される
+#   agent.learn(e, EPISODES)                                          # エピソードごとに1行のJSONを追記
+
+class _NullSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SECTION = _NullSection()
+
+class _Section:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler.sync is not None:
+            self.profiler.sync()
+        self.profiler.totals[self.name] += time.perf_counter() - self.start
+        self.profiler.counts[self.name] += 1
+        return False
+
+class Profiler:
+    def __init__(self, enabled=False, log_path=None, sync=None):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.sync = sync  # e.g. torch.cuda.synchronize, so GPU work is charged to the right phase
+        self.reset()
+
+    def reset(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.started = time.perf_counter()
+
+    def section(self, name):
+        if not self.enabled:
+            return _NULL_SECTION
+        return _Section(self, name)
+
+    # 自前で計った時間を加算する(section()のwith文すら避けたいホットパス用)
+    def add(self, name, seconds):
+        if self.enabled:
+            self.totals[name] += seconds
+            self.counts[name] += 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counts[name] += n
+
+    def report(self, **extra):
+        # 前回のreport以降の集計を1行のJSONとして書き出し、カウンタをリセットする
+        if not self.enabled:
+            return None
+        elapsed = time.perf_counter() - self.started
+        record = {
+            'time': time.time(),
+            'elapsed': elapsed,
+            'env_steps_per_sec': self.counts['env_step'] / elapsed if elapsed > 0 else 0.0,
+            'updates_per_sec': self.counts['update'] / elapsed if elapsed > 0 else 0.0,
+            'phases': {
+                name: {
+                    'total': total,
+                    'count': self.counts[name],
+                    'mean_us': total / self.counts[name] * 1e6,
+                    'share': total / elapsed if elapsed > 0 else 0.0,
+                }
+                for name, total in sorted(self.totals.items(), key=lambda item: -item[1])
+            },
+            'counters': {name: n for name, n in self.counts.items() if name not in self.totals},
+        }
+        record.update(extra)
+        if self.log_path is not None:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        self.reset()
+        return record
@@ -15,8 +15,12 @@ class QNetwork(nn.Module):
         self.action_size = action_size
         self.support = support
 
-    def forward(self, state):
+    # 各行動の価値分布(アトムごとの確率)
+    def dist(self, state):
         x = torch.relu(self.fc1(state))
         x = torch.relu(self.fc2(x))
         x = self.fc3(x)
-        return torch.softmax(x.view(-1, self.action_size, self.atom_size), dim=2) * self.support
\ No newline at end of file
+        return torch.softmax(x.view(-1, self.action_size, self.atom_size), dim=2)
+
+    def forward(self, state):
+        return self.dist(state) * self.support
\ No newline at end of file
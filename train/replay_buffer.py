@@ -0,0 +1,271 @@
+import json
+import os
+import numpy as np
+
+class ReplayBuffer:
+    # 固定容量のNumPy配列に遷移を格納するリングバッファ
+    # 挿入はO(1)、ミニバッチはインデックスの一括参照で取り出す
+    def __init__(self, capacity, state_size):
+        self.capacity = capacity
+        self.state_size = state_size
+        self.position = 0
+        self.size = 0
+        self._allocate()
+
+    # (属性名, 形状, dtype) の一覧。サブクラスはここを差し替えて保存形式を変える
+    def _layout(self):
+        return [
+            ('states', (self.capacity, self.state_size), np.float32),
+            ('actions', (self.capacity,), np.int64),
+            ('rewards', (self.capacity,), np.float32),
+            ('next_states', (self.capacity, self.state_size), np.float32),
+            ('dones', (self.capacity,), np.float32),
+        ]
+
+    def _allocate(self):
+        for name, shape, dtype in self._layout():
+            setattr(self, name, np.zeros(shape, dtype=dtype))
+
+    def __len__(self):
+        return self.size
+
+    # stepは環境の行番号で、IndexedReplayBufferだけが使う
+    def add(self, state, action, reward, next_state, done, step=None):
+        i = self.position
+        self.states[i] = np.reshape(state, -1)
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = np.reshape(next_state, -1)
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    # 複数の遷移をまとめて書き込み、書き込んだ位置を返す
+    def _advance(self, n):
+        idx = (self.position + np.arange(n)) % self.capacity
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return idx
+
+    def add_batch(self, states, actions, rewards, next_states, dones, steps=None):
+        n = len(actions)
+        idx = self._advance(n)
+        self.states[idx] = np.reshape(states, (n, -1))
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = np.reshape(next_states, (n, -1))
+        self.dones[idx] = dones
+        return idx
+
+    def sample(self, batch_size):
+        # Sampled with replacement; duplicates are negligible once the buffer is large
+        idx = np.random.randint(0, self.size, size=batch_size)
+        return self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx]
+
+class SumTree:
+    # 優先度付き経験再生用の配列ベースの二分木。葉に優先度、内部ノードに子の和を持つ
+    # tree[1]が根で、ノードiの子は2iと2i+1。葉はtree[leaf_offset:]に並ぶ
+    def __init__(self, capacity):
+        self.leaf_offset = 1 << max(0, (capacity - 1).bit_length())
+        self.depth = self.leaf_offset.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaf_offset, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[indices + self.leaf_offset]
+
+    def update_one(self, index, priority):
+        node = index + self.leaf_offset
+        self.tree[node] = priority
+        node //= 2
+        while node >= 1:
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+            node //= 2
+
+    def update(self, indices, priorities):
+        # Leaves are all on one level, so parents can be recomputed one level at a time.
+        # Duplicate parents just write the same sum twice
+        nodes = np.asarray(indices) + self.leaf_offset
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes //= 2
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        # Descend from the root for every value at once; values must lie in [0, total)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values = values - left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.leaf_offset
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    # 優先度付き経験再生(Prioritized Experience Replay)
+    # 優先度はC51のサンプルごとのクロスエントロピー損失から更新し、重要度重みを損失に掛ける
+    def __init__(self, capacity, state_size, alpha=0.6, beta=0.4, beta_increment=1e-5, eps=1e-6):
+        super().__init__(capacity, state_size)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0
+
+    def add(self, state, action, reward, next_state, done, step=None):
+        # New transitions get the current max priority so each is replayed at least once
+        self.tree.update_one(self.position, self.max_priority ** self.alpha)
+        super().add(state, action, reward, next_state, done, step)
+
+    def add_batch(self, states, actions, rewards, next_states, dones, steps=None):
+        idx = super().add_batch(states, actions, rewards, next_states, dones, steps)
+        self.tree.update(idx, np.full(len(idx), self.max_priority ** self.alpha))
+        return idx
+
+    def sample(self, batch_size):
+        # Stratified sampling: one uniform draw from each of batch_size equal slices of the total
+        total = self.tree.total()
+        values = (np.arange(batch_size) + np.random.rand(batch_size)) * (total / batch_size)
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+
+        probs = self.tree.get(idx) / total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        return (self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx],
+                idx, weights.astype(np.float32))
+
+    def update_priorities(self, indices, losses):
+        priorities = np.abs(losses) + self.eps
+        self.tree.update(indices, priorities ** self.alpha)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+class IndexedReplayBuffer(ReplayBuffer):
+    # 観測の大部分を占める市場特徴量は保存せず、環境の特徴量行列(env.features)の行番号と
+    # ポートフォリオの4変数だけを保持する。ミニバッチ取得時に観測を組み立て直す
+    def __init__(self, capacity, features):
+        self.features = features
+        self.n_features = features.shape[1]
+        super().__init__(capacity, self.n_features + 4)
+
+    def _layout(self):
+        return [
+            ('steps', (self.capacity,), np.int32),
+            ('portfolio', (self.capacity, 4), np.float32),
+            ('next_portfolio', (self.capacity, 4), np.float32),
+            ('actions', (self.capacity,), np.int8),
+            ('rewards', (self.capacity,), np.float32),
+            ('dones', (self.capacity,), np.bool_),
+        ]
+
+    def add(self, state, action, reward, next_state, done, step=None):
+        if step is None:
+            raise ValueError("IndexedReplayBuffer needs the env row index (step) of each state")
+        i = self.position
+        self.steps[i] = step
+        self.portfolio[i] = np.reshape(state, -1)[-4:]
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_portfolio[i] = np.reshape(next_state, -1)[-4:]
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_batch(self, states, actions, rewards, next_states, dones, steps=None):
+        if steps is None:
+            raise ValueError("IndexedReplayBuffer needs the env row index (step) of each state")
+        n = len(actions)
+        idx = self._advance(n)
+        self.steps[idx] = steps
+        self.portfolio[idx] = np.reshape(states, (n, -1))[:, -4:]
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_portfolio[idx] = np.reshape(next_states, (n, -1))[:, -4:]
+        self.dones[idx] = dones
+        return idx
+
+    def _build_observations(self, steps, portfolio):
+        obs = np.empty((len(steps), self.state_size), dtype=np.float32)
+        np.take(self.features, steps, axis=0, out=obs[:, :self.n_features])
+        obs[:, self.n_features:] = portfolio
+        return obs
+
+    def sample(self, batch_size):
+        idx = np.random.randint(0, self.size, size=batch_size)
+        steps = self.steps[idx]
+        dones = self.dones[idx]
+        # TradingEnvMatsui advances one row per step and stays on the last row once done
+        next_steps = steps + ~dones
+        states = self._build_observations(steps, self.portfolio[idx])
+        next_states = self._build_observations(next_steps, self.next_portfolio[idx])
+        return states, self.actions[idx].astype(np.int64), self.rewards[idx], next_states, dones.astype(np.float32)
+
+class MemmapReplayBuffer(ReplayBuffer):
+    # 遷移をディスク上のnp.memmapに保存するリプレイバッファ。RAMに収まらない長期間の学習用
+    # path以下に配列ごとの.npyファイル(形状とdtypeはヘッダに記録)とmeta.jsonを置き、
+    # 既存のディレクトリを渡すと書き込み位置と件数を復元して学習を再開できる
+    def __init__(self, path, capacity, state_size, flush_interval=100000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._unflushed = 0
+        super().__init__(capacity, state_size)
+
+    def _meta_path(self):
+        return os.path.join(self.path, 'meta.json')
+
+    def _allocate(self):
+        os.makedirs(self.path, exist_ok=True)
+        resume = os.path.exists(self._meta_path())
+        if resume:
+            with open(self._meta_path()) as f:
+                meta = json.load(f)
+            if meta['capacity'] != self.capacity or meta['state_size'] != self.state_size:
+                raise ValueError(f"{self.path} holds a buffer of capacity {meta['capacity']} and state_size "
+                                 f"{meta['state_size']}, not {self.capacity} and {self.state_size}")
+            self.position = meta['position']
+            self.size = meta['size']
+
+        for name, shape, dtype in self._layout():
+            filename = os.path.join(self.path, name + '.npy')
+            if resume:
+                array = np.lib.format.open_memmap(filename, mode='r+')
+            else:
+                array = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+            setattr(self, name, array)
+
+        if not resume:
+            self.flush()
+
+    def add(self, state, action, reward, next_state, done, step=None):
+        super().add(state, action, reward, next_state, done, step)
+        self._unflushed += 1
+        if self._unflushed >= self.flush_interval:
+            self.flush()
+
+    def add_batch(self, states, actions, rewards, next_states, dones, steps=None):
+        idx = super().add_batch(states, actions, rewards, next_states, dones, steps)
+        self._unflushed += len(idx)
+        if self._unflushed >= self.flush_interval:
+            self.flush()
+        return idx
+
+    def sample(self, batch_size):
+        # Sorted indices turn the random reads into one forward sweep over each file
+        idx = np.sort(np.random.randint(0, self.size, size=batch_size))
+        return tuple(np.asarray(getattr(self, name)[idx]) for name in ('states', 'actions', 'rewards', 'next_states', 'dones'))
+
+    def flush(self):
+        # Write dirty pages back so the OS can drop them, then record how far the ring got
+        for name, _, _ in self._layout():
+            getattr(self, name).flush()
+        meta = {'capacity': self.capacity, 'state_size': self.state_size, 'position': self.position, 'size': self.size}
+        tmp_path = self._meta_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path())
+        self._unflushed = 0
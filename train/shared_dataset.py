@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from feature_engineer import FeatureEngineer
+
+# 特徴量行列を一度だけ計算して共有メモリに置き、複数のワーカープロセスから読み取り専用のビューとして参照する
+# pickleされるのは共有メモリの名前と列情報だけなので、ワーカー数が増えてもメモリ使用量は増えない
+#
+# usage:
+#   dataset = SharedDataset.load('../csv/BTCUSDT_1m_20210801_20221231.csv')
+#   env = TradingEnvMatsui(dataset)      # DataFrameの代わりに渡せる
+#   ...
+#   dataset.unlink()                     # 作成したプロセスで最後に解放する
+
+class SharedDataset:
+    def __init__(self, features_shm, close_shm, n_rows, columns, start=0, end=None, owner=False):
+        self._features_shm = features_shm
+        self._close_shm = close_shm
+        self.n_rows = n_rows
+        self.columns = list(columns)
+        self.start = start
+        self.end = n_rows if end is None else end
+        self.owner = owner
+
+        features = np.ndarray((n_rows, len(self.columns)), dtype=np.float32, buffer=features_shm.buf)
+        close = np.ndarray((n_rows,), dtype=np.float64, buffer=close_shm.buf)
+        features.flags.writeable = False
+        close.flags.writeable = False
+        self.features = features[self.start:self.end]
+        self.close = close[self.start:self.end]
+
+    @classmethod
+    def publish(cls, df):
+        # 数値の列だけを特徴量にする(FeatureCacheは時刻の文字列などの列もそのまま返す)
+        columns = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+        n_rows, n_cols = len(df), len(columns)
+        features_shm = shared_memory.SharedMemory(create=True, size=max(1, n_rows * n_cols * 4))
+        try:
+            close_shm = shared_memory.SharedMemory(create=True, size=max(1, n_rows * 8))
+        except Exception:
+            features_shm.close()
+            features_shm.unlink()
+            raise
+        try:
+            features = np.ndarray((n_rows, n_cols), dtype=np.float32, buffer=features_shm.buf)
+            # Copy column by column to avoid materializing a second full-size matrix
+            for j, column in enumerate(columns):
+                features[:, j] = df[column].values
+            np.ndarray((n_rows,), dtype=np.float64, buffer=close_shm.buf)[:] = df['close'].values
+        except Exception:
+            # 共有メモリは明示的に解放しないと/dev/shmに残る
+            features = None
+            for shm in (features_shm, close_shm):
+                shm.close()
+                shm.unlink()
+            raise
+        return cls(features_shm, close_shm, n_rows, columns, owner=True)
+
+    @classmethod
+    def load(cls, csv_path, cache=None):
+        # cacheにFeatureCacheを渡すと、計算済みの特徴量をディスクから読み込む
+        if cache is not None:
+            return cls.publish(cache.load(csv_path))
+        df = pd.read_csv(csv_path)
+        df = FeatureEngineer(df).feature_engineering(df)
+        return cls.publish(df)
+
+    @property
+    def handle(self):
+        return {
+            'features_name': self._features_shm.name,
+            'close_name': self._close_shm.name,
+            'n_rows': self.n_rows,
+            'columns': self.columns,
+            'start': self.start,
+            'end': self.end,
+        }
+
+    @classmethod
+    def attach(cls, handle):
+        features_shm = shared_memory.SharedMemory(name=handle['features_name'])
+        close_shm = shared_memory.SharedMemory(name=handle['close_name'])
+        return cls(features_shm, close_shm, handle['n_rows'], handle['columns'], handle['start'], handle['end'])
+
+    def __reduce__(self):
+        # Workers receive only the handle and attach to the same memory
+        return (SharedDataset.attach, (self.handle,))
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def shape(self):
+        return self.features.shape
+
+    def slice(self, start, end):
+        return SharedDataset(self._features_shm, self._close_shm, self.n_rows, self.columns,
+                             self.start + start, self.start + end)
+
+    def to_frame(self):
+        # float32の単一ブロックなので、DataFrameもコピーせずに共有メモリを参照する
+        return pd.DataFrame(self.features, columns=self.columns, copy=False)
+
+    def close_handles(self):
+        self.features = None
+        self.close = None
+        self._features_shm.close()
+        self._close_shm.close()
+
+    def unlink(self):
+        if not self.owner:
+            raise RuntimeError("only the process that published the dataset should unlink it")
+        self.close_handles()
+        self._features_shm.unlink()
+        self._close_shm.unlink()
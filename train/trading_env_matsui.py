@@ -1,16 +1,28 @@
 import gym
+import time
 import numpy as np
 import pandas as pd
 from gym import spaces
+from profiler import Profiler
 
 class TradingEnvMatsui(gym.Env):
     def __init__(self, df, gamma=0.95, f=0.5, eta=0.1, max_holdings=1):
         super(TradingEnvMatsui, self).__init__()
 
         self.df = df
+        # DataFrameは構築時に一度だけfloat32の連続配列に変換し、観測は事前確保したバッファに書き込む
+        # dfにはSharedDatasetも渡せる。その場合は共有メモリ上の配列をコピーせずに参照する
+        if isinstance(df, pd.DataFrame):
+            self.features = np.ascontiguousarray(df.values, dtype=np.float32)
+            self.close = df['close'].tolist()  # Python floats keep the per-step price math cheap
+        else:
+            self.features = df.features
+            self.close = df.close
+        self.n_features = self.features.shape[1]
+        self._obs = np.empty(self.n_features + 4, dtype=np.float32)
         self.reward_range = (-np.inf, np.inf)
         self.action_space = spaces.Discrete(3)  # 0: Do nothing, 1: Buy, 2: Sell
-        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(self.df.shape[1] + 4,))
+        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(self.n_features + 4,))
 
         self.cash_initial = 1000000
         self.cash = self.cash_initial
@@ -28,13 +40,14 @@ class TradingEnvMatsui(gym.Env):
         self.eta = eta  # Learning rate for f
         self.purchase_price = 0  # To track purchase price for delayed reward calculation
         self.transaction_cost = 0.001
+        self.profiler = Profiler()  # Agent(profiler=...) replaces this with its own
 
     def step(self, action):
         assert self.action_space.contains(action)
 
-        current_price = self.df.iloc[self.current_step]['close']
+        current_price = float(self.close[self.current_step])
         # Check if done before incrementing the step
-        done = self.current_step == len(self.df) - 1
+        done = self.current_step == len(self.close) - 1
         if done:
             return self._get_observation(), 0, done, {}
 
@@ -42,20 +55,25 @@ class TradingEnvMatsui(gym.Env):
         old_total_asset = self.cash + self.holdings * self.purchase_price
         reward = 0
         penalty = 0.1
+        outcome = 'env_hold'
 
         if action == 1:  # Buy
             if self.cash >= current_price and self.holdings < self.max_holdings:
                 self.holdings += 1
                 self.cash -= current_price * (1 + self.transaction_cost)
                 self.purchase_price = current_price
+                outcome = 'env_buy'
             else:
                 reward -= penalty
+                outcome = 'env_rejected'
         elif action == 2:  # Sell
             if self.holdings > 0:
                 self.holdings -= 1
                 self.cash += current_price * (1 - self.transaction_cost)
+                outcome = 'env_sell'
             else:
                 reward -= penalty
+                outcome = 'env_rejected'
 
         new_total_asset = self.cash + self.holdings * current_price
 
@@ -80,6 +98,11 @@ class TradingEnvMatsui(gym.Env):
 
         total_asset = self.cash + self.holdings * current_price
 
+        # Profiling is checked once on each side so it costs next to nothing when disabled
+        profiled = self.profiler.enabled
+        if profiled:
+            bookkeeping_start = time.perf_counter()
+
         # Record the history
         self.history.append({
             "step": self.current_step,
@@ -95,7 +118,11 @@ class TradingEnvMatsui(gym.Env):
         self.total_asset_history.append(total_asset)
         self.holdings_history.append(self.holdings)
 
-        return self._get_observation(), reward, done, {}
+        obs = self._get_observation()
+        if profiled:
+            self.profiler.add('env_bookkeeping', time.perf_counter() - bookkeeping_start)
+            self.profiler.count(outcome)
+        return obs, reward, done, {}
     
     def reset(self):
         self.cash = self.cash_initial
@@ -110,4 +137,11 @@ class TradingEnvMatsui(gym.Env):
         total_asset = self.cash + self.holdings * self.purchase_price
         cash_ratio = self.cash / total_asset
         holdings_ratio = self.holdings * self.purchase_price / total_asset
-        return np.append(self.df.iloc[self.current_step], [self.holdings, self.cash, cash_ratio, holdings_ratio])
\ No newline at end of file
+        obs = self._obs
+        obs[:self.n_features] = self.features[self.current_step]
+        obs[-4] = self.holdings
+        obs[-3] = self.cash
+        obs[-2] = cash_ratio
+        obs[-1] = holdings_ratio
+        # The agent keeps both state and next_state, so hand out a copy of the buffer
+        return obs.copy()
\ No newline at end of file
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from gym import spaces
+
+class VecTradingEnvMatsui:
+    # TradingEnvMatsuiをnum_envs本まとめて同時に進める環境
+    # ポートフォリオの状態(cash, holdings, purchase_price, f)はNumPy配列で保持する
+    def __init__(self, df, num_envs, gamma=0.95, f=0.5, eta=0.1, max_holdings=1):
+        self.df = df
+        self.num_envs = num_envs
+        # dfにはSharedDatasetも渡せる
+        if isinstance(df, pd.DataFrame):
+            self.features = np.ascontiguousarray(df.values, dtype=np.float32)
+            self.close = df['close'].values.astype(np.float64)
+        else:
+            self.features = df.features
+            self.close = df.close
+        self.n_steps = len(self.close)
+        self.n_features = self.features.shape[1]
+
+        self.reward_range = (-np.inf, np.inf)
+        self.single_action_space = spaces.Discrete(3)  # 0: Do nothing, 1: Buy, 2: Sell
+        self.single_observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(self.n_features + 4,))
+        self.action_space = spaces.MultiDiscrete([3] * num_envs)
+        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(num_envs, self.n_features + 4))
+
+        self.cash_initial = 1000000
+        self.max_holdings = max_holdings
+        self.gamma = gamma  # Discount factor
+        self.eta = eta  # Learning rate for f
+        self.transaction_cost = 0.001
+        self.penalty_idle = -0.5
+
+        self.cash = np.full(num_envs, self.cash_initial, dtype=np.float64)
+        self.holdings = np.zeros(num_envs, dtype=np.int64)
+        self.purchase_price = np.zeros(num_envs, dtype=np.float64)
+        self.f = np.full(num_envs, f, dtype=np.float64)  # Investment ratio parameter (bet fraction)
+        self.episode_reward = np.zeros(num_envs, dtype=np.float64)
+        self.current_step = np.zeros(num_envs, dtype=np.int64)
+
+    def reset(self, indices=None, start_steps=None):
+        # indicesを指定すると、その環境だけをリセットする
+        if indices is None:
+            indices = np.arange(self.num_envs)
+        indices = np.asarray(indices)
+        self.cash[indices] = self.cash_initial
+        self.holdings[indices] = 0
+        self.purchase_price[indices] = 0
+        self.f[indices] = 0.5  # Reset the investment ratio
+        self.episode_reward[indices] = 0
+        self.current_step[indices] = 0 if start_steps is None else start_steps
+        return self._get_observation()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        assert actions.shape == (self.num_envs,) and ((actions >= 0) & (actions < 3)).all()
+
+        current_price = self.close[self.current_step]
+        # Check if done before incrementing the step
+        done = self.current_step == self.n_steps - 1
+        active = ~done
+
+        self.current_step += active
+        old_total_asset = self.cash + self.holdings * self.purchase_price
+
+        buy = active & (actions == 1) & (self.cash >= current_price) & (self.holdings < self.max_holdings)
+        sell = active & (actions == 2) & (self.holdings > 0)
+        self.holdings += buy
+        self.holdings -= sell
+        self.cash = np.where(buy, self.cash - current_price * (1 + self.transaction_cost), self.cash)
+        self.cash = np.where(sell, self.cash + current_price * (1 - self.transaction_cost), self.cash)
+        self.purchase_price = np.where(buy, current_price, self.purchase_price)
+
+        new_total_asset = self.cash + self.holdings * current_price
+
+        # Calculate reward as the compound, discounted return on total asset
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reward = (new_total_asset - old_total_asset) / old_total_asset
+            reward = np.where(old_total_asset > 0, (1 + reward * self.f) ** self.gamma, 0.0)
+
+        # If no stocks are held and no action is taken, reward is zero due to lost opportunity.
+        reward = np.where((self.holdings == 0) & (actions == 0), self.penalty_idle, reward)
+        # Finished episodes stay put and earn nothing, as in the single env
+        reward = np.where(active, reward, 0.0)
+
+        # Update f using online gradient method
+        f = self.f + self.eta * reward / (1 + reward * self.f)
+        self.f = np.where(active, np.clip(f, 0, 0.99), self.f)
+        self.episode_reward += reward
+
+        return self._get_observation(), reward, done, {}
+
+    def _get_observation(self):
+        obs = np.empty((self.num_envs, self.n_features + 4), dtype=np.float32)
+        np.take(self.features, self.current_step, axis=0, out=obs[:, :self.n_features])
+        total_asset = self.cash + self.holdings * self.purchase_price
+        obs[:, -4] = self.holdings
+        obs[:, -3] = self.cash
+        obs[:, -2] = self.cash / total_asset
+        obs[:, -1] = self.holdings * self.purchase_price / total_asset
+        return obs